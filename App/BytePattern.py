@@ -0,0 +1,60 @@
+import re
+
+MAX_MATCH_LENGTH = 0x1000
+
+
+class BytePattern:
+    """
+    A search pattern, compiled once before the search.
+
+    Literal byte sequences are searched with bytes.find(). Hex patterns with
+    wildcards, like "4D 5A ?? ?? 50 45", and nibble masks, like "4? ?D", as
+    well as regular expressions are compiled to a bytes regex.
+
+    length is the length of every match, or None for regular expressions.
+    Their matches are limited to maxLength bytes, which is also the overlap of
+    the windows the data is streamed through.
+    """
+
+    def __init__(self, literal: bytes = None, regex: re.Pattern = None, length: int = None,
+                 maxLength: int = MAX_MATCH_LENGTH):
+        self.literal = literal
+        self.regex = regex
+        self.length = len(literal) if literal is not None else length
+        self.maxLength = self.length if self.length is not None else maxLength
+
+    def isEmpty(self) -> bool:
+        return self.literal is not None and len(self.literal) == 0
+
+    @staticmethod
+    def fromBytes(array: bytes) -> 'BytePattern':
+        return BytePattern(literal=bytes(array))
+
+    @staticmethod
+    def fromHex(text: str) -> 'BytePattern':
+        # Every byte is two hex digits, a '?' stands for any nibble
+        digits = ''.join(text.split())
+        if len(digits) % 2 != 0:
+            raise ValueError('odd number of hex digits')
+        if '?' not in digits:
+            return BytePattern.fromBytes(bytes.fromhex(digits))
+        regex = bytearray()
+        for idx in range(0, len(digits), 2):
+            high, low = digits[idx], digits[idx + 1]
+            if high == '?' and low == '?':
+                regex += b'.'
+            elif high == '?':
+                regex += b'[' + b''.join(b'\\x%x%s' % (n, low.encode()) for n in range(16)) + b']'
+            elif low == '?':
+                regex += b'[\\x%s0-\\x%sf]' % (high.encode(), high.encode())
+            else:
+                regex += re.escape(bytes.fromhex(high + low))
+        try:
+            return BytePattern(regex=re.compile(bytes(regex), re.DOTALL), length=len(digits) // 2)
+        except re.error:
+            raise ValueError('invalid hex digit')
+
+    @staticmethod
+    def fromRegex(text: str, maxLength: int = MAX_MATCH_LENGTH) -> 'BytePattern':
+        # Raises re.error for an invalid expression
+        return BytePattern(regex=re.compile(text.encode('utf-8')), maxLength=maxLength)
@@ -0,0 +1,170 @@
+from PyQt5.QtWidgets import QWidget, QComboBox, QLabel, QLineEdit, QProgressBar, QPushButton, QFormLayout, \
+    QHBoxLayout, QVBoxLayout
+from App.QHexEdit import QHexEdit
+from App.Checksums import ALGORITHMS, ChecksumCache, computeChecksums
+from App.Worker import Worker
+
+
+# noinspection PyUnresolvedReferences
+class ChecksumPanel(QWidget):
+    """
+    Shows the checksums of the edited data, of the whole file or of the
+    selection. They are computed on a worker thread over a snapshot of the
+    data, the data can be edited meanwhile. Results are cached by the state
+    of the data, checking a state again shows them at once.
+
+    The root of the hash tree of the whole data is updated on request, after
+    the first time only the leaves around the edits are hashed. The regions
+    which differ from the original data are listed with it.
+    """
+
+    def __init__(self, hexEdit: QHexEdit, parent: QWidget = None):
+        super().__init__(parent)
+        self.hexEdit = hexEdit
+        self.worker = None
+        self.cache = ChecksumCache()
+        self.running = None # (state, position, length) of the running computation
+
+        self.comboScope = QComboBox(self)
+        self.comboScope.addItems(['Whole file', 'Selection'])
+        self.comboScope.currentIndexChanged.connect(self.showCurrent)
+        self.buttonCompute = QPushButton('Compute', self)
+        self.buttonCompute.clicked.connect(self.compute)
+        self.buttonTree = QPushButton('Hash Tree', self)
+        self.buttonTree.clicked.connect(self.computeTree)
+        self.progressBar = QProgressBar(self)
+        self.progressBar.setRange(0, 1000)
+        self.buttonCancel = QPushButton('Cancel', self)
+        self.buttonCancel.clicked.connect(self.cancel)
+        self.labelResult = QLabel(self)
+        self.fields = {}
+
+        topLayout = QHBoxLayout()
+        topLayout.addWidget(self.comboScope)
+        topLayout.addWidget(self.buttonCompute)
+        topLayout.addWidget(self.buttonTree)
+        topLayout.addWidget(self.progressBar)
+        topLayout.addWidget(self.buttonCancel)
+        formLayout = QFormLayout()
+        for name in ALGORITHMS:
+            self.fields[name] = QLineEdit(self)
+            self.fields[name].setReadOnly(True)
+            formLayout.addRow(name, self.fields[name])
+        self.fieldTree = QLineEdit(self)
+        self.fieldTree.setReadOnly(True)
+        formLayout.addRow('Tree', self.fieldTree)
+        self.labelTree = QLabel(self)
+        formLayout.addRow('', self.labelTree)
+        mainLayout = QVBoxLayout(self)
+        mainLayout.addLayout(topLayout)
+        mainLayout.addWidget(self.labelResult)
+        mainLayout.addLayout(formLayout)
+        mainLayout.addStretch()
+        self.showRunning(False)
+
+        self.hexEdit.dataChanged.connect(self.showCurrent)
+        self.hexEdit.currentAddressChanged.connect(self.showCurrent)
+
+    def setHexEdit(self, hexEdit: QHexEdit) -> None:
+        # A running computation goes on, its result is cached by the state it belongs to
+        self.hexEdit.dataChanged.disconnect(self.showCurrent)
+        self.hexEdit.currentAddressChanged.disconnect(self.showCurrent)
+        self.hexEdit = hexEdit
+        self.hexEdit.dataChanged.connect(self.showCurrent)
+        self.hexEdit.currentAddressChanged.connect(self.showCurrent)
+        self.showCurrent()
+
+    def range(self) -> tuple:
+        if self.comboScope.currentIndex() == 1:
+            begin = self.hexEdit.getSelectionBegin()
+            return begin, self.hexEdit.getSelectionEnd() - begin
+        return 0, self.hexEdit.chunks.size
+
+    def key(self) -> tuple:
+        return (self.hexEdit.chunks.state(),) + self.range()
+
+    def showCurrent(self) -> None:
+        # Shows the cached checksums of the current data, if there are any
+        if self.worker is not None:
+            return
+        checksums = self.cache.get(*self.key())
+        for name in ALGORITHMS:
+            self.fields[name].setText(checksums[name] if checksums is not None else '')
+        _, length = self.range()
+        self.labelResult.setText(f"{length} bytes" if checksums is not None else '')
+        self.showTree()
+
+    def compute(self) -> None:
+        if self.worker is not None:
+            return
+        key = self.key()
+        if self.cache.get(*key) is not None:
+            self.showCurrent()
+            return
+        self.running = key
+        self.start(Worker(computeChecksums, self.hexEdit.chunks.snapshot(), key[1], key[2], ALGORITHMS),
+                   self.checksumsComputed)
+
+    def computeTree(self) -> None:
+        if self.worker is not None:
+            return
+        chunks = self.hexEdit.chunks
+        # the tree keeps its result, it is shown when the worker is finished
+        self.start(Worker(chunks.hashTree.update, chunks.snapshot()))
+
+    def start(self, worker: Worker, resultSlot=None) -> None:
+        self.worker = worker
+        self.worker.signals.progress.connect(self.showProgress)
+        if resultSlot is not None:
+            self.worker.signals.result.connect(resultSlot)
+        self.worker.signals.finished.connect(self.computeFinished)
+        self.labelResult.setText('Computing...')
+        self.showRunning(True)
+        self.worker.start()
+
+    def cancel(self) -> None:
+        if self.worker is not None:
+            self.worker.cancel()
+
+    def showRunning(self, running: bool) -> None:
+        self.progressBar.setValue(0)
+        self.progressBar.setVisible(running)
+        self.buttonCancel.setVisible(running)
+        self.buttonCompute.setEnabled(not running)
+        self.buttonTree.setEnabled(not running)
+
+    def showProgress(self, done: int, total: int) -> None:
+        self.progressBar.setValue(done * 1000 // total if total > 0 else 1000)
+
+    def checksumsComputed(self, checksums: dict) -> None:
+        self.cache.put(*self.running, checksums)
+
+    def showTree(self) -> None:
+        # The tree is shown while it belongs to the current data
+        tree = self.hexEdit.chunks.hashTree
+        if tree.result is None or tree.state is not self.hexEdit.chunks.state():
+            self.fieldTree.clear()
+            self.labelTree.clear()
+            return
+        root, leaves, regions, rehashed = tree.result
+        self.fieldTree.setText(root)
+        changed = sum(length for _, length in regions)
+        text = f"{leaves} leaves, {rehashed} bytes hashed, "
+        if len(regions) == 0:
+            text += "equal to the original"
+        else:
+            text += f"{len(regions)} regions with {changed} bytes differ from the original, " \
+                    f"first at {regions[0][0]}"
+        self.labelTree.setText(text)
+
+    def computeFinished(self, success: bool) -> None:
+        checksums = self.running is not None
+        self.worker = None
+        self.running = None
+        self.showRunning(False)
+        self.showCurrent()
+        if not success:
+            self.labelResult.setText('Canceled')
+        elif checksums and not self.labelResult.text():
+            # the data was changed while the checksums were computed
+            self.labelResult.setText('Data changed, compute again')
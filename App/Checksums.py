@@ -0,0 +1,70 @@
+import hashlib
+import zlib
+from collections import OrderedDict
+
+ALGORITHMS = ('MD5', 'SHA-1', 'SHA-256', 'CRC32')
+CHECKSUM_CACHE = 64
+
+
+class Crc32:
+    # zlib.crc32 with the interface of the hashlib objects
+    def __init__(self):
+        self.value = 0
+
+    def update(self, data: bytes) -> None:
+        self.value = zlib.crc32(data, self.value)
+
+    def hexdigest(self) -> str:
+        return f"{self.value:08x}"
+
+
+def newHash(name: str):
+    if name == 'CRC32':
+        return Crc32()
+    return hashlib.new(name.replace('-', '').lower())
+
+
+def computeChecksums(snapshot, position: int, length: int, names: tuple = ALGORITHMS):
+    """
+    Job of a Worker: computes all checksums of length bytes of the snapshot
+    from position on in one pass. The data is streamed in the segments of
+    the snapshot, unmodified ranges of a mapped file are not copied. The
+    last item carries {name: hex digest}.
+    """
+    hashes = [newHash(name) for name in names]
+    done = 0
+    for array, _ in snapshot.segments(position, length):
+        for hash in hashes:
+            hash.update(array)
+        done += len(array)
+        yield done, length, None
+    yield length, length, {name: hash.hexdigest() for name, hash in zip(names, hashes)}
+
+
+class ChecksumCache:
+    """
+    Checksums by the state of the data and the range they cover. The state is
+    the root of the piece tree, undo and redo bring back the very same roots,
+    so a state checked before is found again after any number of undo steps.
+    The least recently used entries are dropped beyond CHECKSUM_CACHE.
+    """
+
+    def __init__(self, capacity: int = CHECKSUM_CACHE):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def get(self, state, position: int, length: int) -> dict:
+        key = (state, position, length)
+        result = self.entries.get(key)
+        if result is not None:
+            self.entries.move_to_end(key)
+        return result
+
+    def put(self, state, position: int, length: int, checksums: dict) -> None:
+        self.entries[(state, position, length)] = checksums
+        self.entries.move_to_end((state, position, length))
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
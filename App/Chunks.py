@@ -1,189 +1,476 @@
-import sys
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
 
-from PyQt5.QtCore import QObject, QIODevice, QBuffer
+from PyQt5.QtCore import QObject, QIODevice, QBuffer, QFile, QStorageInfo
+from PyQt5.QtCore import pyqtSignal as QSignal
+from App.PieceTable import PieceTable, ORIGINAL
+from App.SearchEngine import SearchEngine
+from App.BytePattern import BytePattern
+from App.Signatures import Signatures
+from App.IntervalSet import IntervalSet
+from App.HashTree import HashTree
+from App.Stats import stats
+from App.Worker import Canceled
 
 NORMAL = b'\x00'
 HIGHLIGHTED = b'\x01'
 CHUNK_SIZE = 0x1000
 BUFFER_SIZE = 0x10000
+SEGMENT_SIZE = 0x100000
+PAGE_SIZE = 0x10000
+CLEAN_PAGES = 256
+JOURNAL_MAGIC = b'PYHEXJNL'
+JOURNAL_END = 0xFFFFFFFFFFFFFFFF
+# Seconds writeInPlace() waits for the readers of the snapshots to stop
+EXPIRE_TIMEOUT = 10
+# File systems whose files are not mapped, a page fault there can take as long as a network round trip
+REMOTE_FILE_SYSTEMS = (b'nfs', b'nfs4', b'cifs', b'smb3', b'smbfs', b'9p', b'afs', b'ceph', b'glusterfs',
+                       b'davfs', b'fuse')
 
 
-class Chunk:
-    def __init__(self):
-        self.data = bytearray
-        self.dataChanged = bytearray
-        self.absPos: int = 0
+class Chunks(QObject):
+    """
+    Chunks gives access to the data of a QIODevice together with all changes
+    made on it. The device itself is only read, the edited data is described by
+    a storage object (a PieceTable by default) which holds the pieces of the
+    original data and the inserted bytes. The storage class can be exchanged by
+    any class with the same interface.
 
+    Files on local disks are mapped read-only into memory for the whole
+    session, the unmodified ranges are then served as memoryview slices of the map without
+    any system call or copy. Small reads of other devices go through the
+    bounded cache of clean pages which all documents share, see CleanPages.
 
-class Chunks(QObject):
-    def __init__(self, parent: QObject = None, device: QIODevice = None):
+    version is increased with every change of the content, views can cache
+    what they derived from the data as long as it stays the same. The range of
+    bytes changed since the last takeDirtyRange() is tracked as well, so views
+    only need to re-read that part.
+    """
+
+    writeProgress = QSignal('qint64', 'qint64')
+
+    def __init__(self, parent: QObject = None, device: QIODevice = None, storage: type = PieceTable):
         super().__init__(parent)
         self.device = QBuffer(self) if device is None else device
-        self.chunks: list[Chunk] = []
+        self.storage = storage
+        self.pieces = self.storage()
+        self.map = None
+        self.mapView = None
+        self.writeCanceled = False
         self.position = 0
         self.size = 0
+        self.version = 0
+        self.dirtyBegin = -1
+        self.dirtyEnd = -1
+        self.deviceSize = 0
+        self.deviceLock = threading.Lock()
+        self.readers = SnapshotReaders()
+        self.cleanPages = DevicePages(sharedPages)
+        self.hashTree = HashTree()
+        self.searchEngine = SearchEngine(self)
 
         self.setIODevice(self.device)
 
     def setIODevice(self, device: QIODevice) -> bool:
+        self.unmapDevice()
         self.device = device
-        status = self.device.open(QIODevice.ReadOnly)
+        with self.deviceLock:
+            status = self.device.open(QIODevice.ReadOnly)
+            if status:
+                self.size = self.device.size()
+                self.device.close()
         if status:
-            self.size = self.device.size()
-            self.device.close()
+            self.mapDevice()
         else:
             # Fallback is an empty buffer
             self.size = 0
             self.device = QBuffer(self)
-        self.chunks.clear()
+        self.deviceSize = self.size
+        # snapshots of the former device keep their own pages
+        self.cleanPages = DevicePages(sharedPages)
+        self.hashTree = HashTree()
+        self.pieces = self.storage(self.size)
         self.position = 0
+        self.version += 1
+        self.markDirty(0, -1)
         return status
 
+    def mapDevice(self) -> bool:
+        # Only files on local disks are mapped, all other devices are read through QIODevice
+        if not isinstance(self.device, QFile) or self.size == 0 or not Chunks.isLocalDisk(self.device.fileName()):
+            return False
+        try:
+            with open(self.device.fileName(), 'rb') as file:
+                self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+        mappedFiles[self.map] = os.path.realpath(self.device.fileName())
+        if len(self.map) != self.size:
+            self.unmapDevice()
+            return False
+        self.mapView = memoryview(self.map)
+        return True
+
+    @staticmethod
+    def isLocalDisk(fileName: str) -> bool:
+        # False for network and FUSE file systems and removable drives, reads from them may block for long
+        storage = QStorageInfo(fileName)
+        if not storage.isValid():
+            return True
+        fileSystem = bytes(storage.fileSystemType()).lower()
+        if fileSystem.split(b'.')[0] in REMOTE_FILE_SYSTEMS or fileSystem == b'fuseblk':
+            return False
+        device = bytes(storage.device()).decode(errors='replace')
+        if device.startswith(('//', '\\\\')):
+            return False
+        if device.startswith('/dev/'):
+            # partitions have the removable flag of their disk
+            block = os.path.realpath('/sys/class/block/' + os.path.basename(os.path.realpath(device)))
+            for flag in (os.path.join(block, 'removable'), os.path.join(block, '..', 'removable')):
+                try:
+                    with open(flag) as file:
+                        return file.read().strip() != '1'
+                except OSError:
+                    pass
+        return True
+
+    def unmapDevice(self) -> None:
+        if self.map is None:
+            return
+        self.mapView.release()
+        try:
+            self.map.close()
+        except BufferError:
+            # slices of the map are still in use, the map is closed with the last of them
+            pass
+        self.map = None
+        self.mapView = None
+
+    def segments(self, position: int, maxSize: int = -1):
+        """
+        Generates (array, changed) for all pieces of the edited data in the
+        range, cut into blocks of at most SEGMENT_SIZE bytes. Unmodified ranges
+        of a mapped file are memoryview slices of the map, they are valid as
+        long as the device is set.
+        """
+        return Snapshot(self).segments(position, maxSize)
+
+    def snapshot(self) -> 'Snapshot':
+        return Snapshot(self)
+
+    @stats.timed('Chunks.data', len)
     def data(self, position: int, maxSize: int = -1, highlighted: bytearray = None) -> bytearray:
-        delta = 0
-        chunkIdx = 0
-        chunk = Chunk()
         buffer = bytearray()
         if highlighted is not None:
             highlighted.clear()
-        if position >= self.size:
-            return buffer
-        if maxSize < 0:
-            maxSize = self.size
-        elif (position + maxSize) > self.size:
-            maxSize = self.size - position
-
-        self.device.open(QIODevice.ReadOnly)
-        while maxSize > 0:
-            chunk.absPos = sys.maxsize
-            chunksLoopOngoing = True
-            while chunkIdx < len(self.chunks) and chunksLoopOngoing:
-                # In this section, we track changes before our required data and
-                # we take the editdet data, if availible. ioDelta is a difference
-                # counter to justify the read pointer to the original data, if
-                # data in between was deleted or inserted.
-                chunk = self.chunks[chunkIdx]
-                if chunk.absPos > position:
-                    chunksLoopOngoing = False
-                else:
-                    count = 0
-                    chunkIdx += 1
-                    chunkOfs = position - chunk.absPos
-                    if maxSize > len(chunk.data) - chunkOfs:
-                        count = len(chunk.data) - chunkOfs
-                        delta += CHUNK_SIZE - len(chunk.data)
-                    else:
-                        count = maxSize
-
-                    if count > 0:
-                        buffer += chunk.data[chunkOfs:chunkOfs+count]
-                        maxSize -= count
-                        position += count
-                        if highlighted is not None:
-                            highlighted += chunk.dataChanged[chunkOfs:chunkOfs+count]
-            if maxSize > 0 and position < chunk.absPos:
-                byteCount = 0
-                if (chunk.absPos - position) > maxSize:
-                    byteCount = maxSize
-                else:
-                    byteCount = chunk.absPos - position
-                maxSize -= byteCount
-                self.device.seek(position + delta)
-                readBuffer = self.device.read(byteCount)
-                buffer += readBuffer
-                if highlighted is not None:
-                    highlighted += bytearray(NORMAL*len(readBuffer)) # b'\x00' filled bytearray
-                position += len(readBuffer)
-        self.device.close()
+        for array, changed in self.segments(position, maxSize):
+            buffer += array
+            if highlighted is not None:
+                highlighted += (HIGHLIGHTED if changed else NORMAL) * len(array)
         return buffer
 
     def write(self, device: QIODevice, position: int = 0, count: int = -1) -> bool:
-        if count == -1:
-            count = self.size
-        status = device.open(QIODevice.WriteOnly)
-        if status:
-            for idx in range(position, count, BUFFER_SIZE):
-                array = self.data(idx, BUFFER_SIZE)
-                device.write(array)
-            device.close()
+        """
+        Streams count bytes of the edited data from position on into device.
+        The data is written in blocks of at most SEGMENT_SIZE bytes, unmodified
+        ranges are copied straight from the original device, so the memory
+        needed does not depend on the size of the data. writeProgress is
+        emitted after every block, cancelWrite() stops the writing.
+        A device which is not open is opened and closed again.
+        """
+        opened = not device.isOpen()
+        if opened and not device.open(QIODevice.WriteOnly):
+            return False
+        self.writeCanceled = False
+        status = True
+        blocks = Snapshot(self).write(device, position, count)
+        try:
+            for written, total, _ in blocks:
+                self.writeProgress.emit(written, total)
+                if self.writeCanceled:
+                    status = False
+                    break
+        except OSError:
+            status = False
+        finally:
+            blocks.close()
+            if opened:
+                device.close()
         return status
 
+    def cancelWrite(self) -> None:
+        self.writeCanceled = True
+
+    def dirtyRanges(self) -> list:
+        """
+        Returns the sorted (position, length) ranges of edited bytes, if the
+        edited data can be written back in place: the size is unchanged and
+        all unmodified data is still at its original position. Otherwise None
+        is returned.
+        """
+        if self.size != self.deviceSize:
+            return None
+        ranges = []
+        position = 0
+        for source, offset, length, _ in self.pieces.pieces(0, self.size):
+            if source == ORIGINAL:
+                if offset != position:
+                    return None
+            elif len(ranges) > 0 and sum(ranges[-1]) == position:
+                ranges[-1] = (ranges[-1][0], ranges[-1][1] + length)
+            else:
+                ranges.append((position, length))
+            position += length
+        return ranges
+
+    def originalData(self, position: int, length: int) -> bytes:
+        return Snapshot(self).originalData(position, length)
+
+    def writeInPlace(self, journalName: str = None) -> bool:
+        """
+        Writes only the dirty ranges back into the file of the device, see
+        dirtyRanges(). The original bytes of these ranges are saved in a
+        journal first, in journalName or else in a temporary file. If the
+        writing fails, the file is restored from the journal and False is
+        returned. If even that fails, OSError is raised and the journal is
+        kept for rollbackJournal(). The journal is removed after success.
+
+        The file holds the original data of all snapshots and states taken
+        before. The snapshots are expired first, their readers stop with
+        Canceled and the writing waits for them; False is returned if they
+        do not stop in EXPIRE_TIMEOUT seconds. After success the caller has to
+        set the device again and clear its history, after an OSError it has
+        to clear the history, the states would show the changed bytes.
+        """
+        ranges = self.dirtyRanges()
+        if ranges is None or not isinstance(self.device, QFile):
+            return False
+        if not self.readers.expire(EXPIRE_TIMEOUT):
+            return False
+        fileName = self.device.fileName()
+        if journalName is None:
+            handle, journalName = tempfile.mkstemp(suffix='.journal')
+            os.close(handle)
+        try:
+            self.writeJournal(journalName, ranges)
+        except OSError:
+            # the file is untouched, a journal without its end record is not needed
+            Chunks.removeJournal(journalName)
+            return False
+        try:
+            with open(fileName, 'r+b') as file:
+                for position, length in ranges:
+                    file.seek(position)
+                    for array, _ in self.segments(position, length):
+                        file.write(array)
+                file.flush()
+                os.fsync(file.fileno())
+        except OSError:
+            if not Chunks.restoreJournal(fileName, journalName):
+                raise OSError(f"Cannot restore {fileName}, its journal {journalName} is kept")
+            return False
+        Chunks.removeJournal(journalName)
+        return True
+
+    def writeJournal(self, journalName: str, ranges: list) -> None:
+        # The end record is written last, a journal without it belongs to a save
+        # which was interrupted before the file was touched
+        with open(journalName, 'wb') as journal:
+            journal.write(JOURNAL_MAGIC + struct.pack('<Q', self.deviceSize))
+            for position, length in ranges:
+                journal.write(struct.pack('<QQ', position, length))
+                for ofs in range(position, position + length, SEGMENT_SIZE):
+                    journal.write(self.originalData(ofs, min(SEGMENT_SIZE, position + length - ofs)))
+            journal.write(struct.pack('<QQ', JOURNAL_END, len(ranges)))
+            journal.flush()
+            os.fsync(journal.fileno())
+
+    @staticmethod
+    def isMapped(fileName: str) -> bool:
+        # A map stays open after unmapDevice() while snapshots or slices of it are in use
+        name = os.path.realpath(fileName)
+        return any(not map.closed and mapName == name for map, mapName in list(mappedFiles.items()))
+
+    @staticmethod
+    def removeJournal(journalName: str) -> None:
+        try:
+            os.remove(journalName)
+        except OSError:
+            pass
+
+    @staticmethod
+    def rollbackJournal(fileName: str, journalName: str) -> bool:
+        """
+        Restores the original bytes saved in the journal of an interrupted
+        writeInPlace() and removes the journal. Returns False, if the journal
+        is no journal or the file could not be restored. A mapped file is not
+        touched, its maps would show the restored bytes as original data.
+        """
+        if Chunks.isMapped(fileName):
+            return False
+        return Chunks.restoreJournal(fileName, journalName)
+
+    @staticmethod
+    def restoreJournal(fileName: str, journalName: str) -> bool:
+        # See rollbackJournal(), writeInPlace() restores its own mapped file
+        try:
+            with open(journalName, 'rb') as journal:
+                if journal.read(len(JOURNAL_MAGIC)) != JOURNAL_MAGIC:
+                    return False
+                fileSize, = struct.unpack('<Q', journal.read(8))
+                records = []
+                complete = False
+                while True:
+                    header = journal.read(16)
+                    if len(header) < 16:
+                        break
+                    position, length = struct.unpack('<QQ', header)
+                    if position == JOURNAL_END:
+                        complete = (length == len(records))
+                        break
+                    records.append((position, length, journal.tell()))
+                    journal.seek(length, os.SEEK_CUR)
+                if complete:
+                    if os.path.getsize(fileName) != fileSize:
+                        return False
+                    with open(fileName, 'r+b') as file:
+                        for position, length, journalPos in records:
+                            journal.seek(journalPos)
+                            file.seek(position)
+                            for ofs in range(0, length, SEGMENT_SIZE):
+                                file.write(journal.read(min(SEGMENT_SIZE, length - ofs)))
+                        file.flush()
+                        os.fsync(file.fileno())
+            os.remove(journalName)
+        except (OSError, struct.error):
+            return False
+        return True
+
     def setDataChanged(self, position: int, dataChanged: bool) -> None:
-        if 0 <= self.position < self.size:
-            chunkIdx = self.getChunkIndex(position)
-            posInBa = position - self.chunks[chunkIdx].absPos
-            self.chunks[chunkIdx].dataChanged[posInBa] = dataChanged
+        if 0 <= position < self.size:
+            self.pieces.setChanged(position, 1, dataChanged)
+            self.markDirty(position, position + 1)
 
     def dataChanged(self, position: int) -> bool:
-        highlighted = bytearray()
-        self.data(position, 1, highlighted)
-        return bool(highlighted[0])
+        return any(changed for _, _, _, changed in self.pieces.pieces(position, 1))
+
+    def changedSpans(self, position: int, length: int) -> IntervalSet:
+        # The ranges of changed bytes, the changed flags are kept per piece
+        spans = IntervalSet()
+        for _, _, count, changed in self.pieces.pieces(position, length):
+            if changed:
+                spans.add(position, position + count)
+            position += count
+        return spans
 
     def indexOf(self, array: bytes, _from: int) -> int:
-        res = -1
-        for pos in range(_from, self.size, BUFFER_SIZE):
-            buffer = self.data(pos, BUFFER_SIZE + len(array) - 1)
-            findPos = buffer.find(array)
-            if findPos >= 0:
-                res = pos + findPos
-                break
-        return res
+        return self.searchEngine.indexOf(array, _from)
 
     def lastIndexOf(self, array: bytes, _from: int) -> int:
-        res = -1
-        for pos in range(_from, 0, -BUFFER_SIZE):
-            sPos = pos - BUFFER_SIZE - len(array) + 1
-            if sPos < 0: sPos = 0
-            buffer = self.data(sPos, pos - sPos)
-            findPos = buffer.rfind(array)
-            if findPos >= 0:
-                res = sPos + findPos
-                break
-        return res
+        return self.searchEngine.lastIndexOf(array, _from)
+
+    def search(self, pattern: BytePattern, _from: int) -> tuple:
+        return self.searchEngine.search(pattern, _from)
+
+    def searchBackwards(self, pattern: BytePattern, _from: int) -> tuple:
+        return self.searchEngine.searchBackwards(pattern, _from)
+
+    def findSignatures(self, signatures: Signatures, position: int = 0):
+        return self.searchEngine.findSignatures(signatures, position)
 
     def insert(self, position: int, character: bytes) -> bool:
+        return self.insertRange(position, character[0:1])
+
+    def overwrite(self, position: int, character: bytes) -> bool:
+        return self.overwriteRange(position, character[0:1])
+
+    def removeAt(self, position: int) -> bool:
+        return self.removeRange(position, 1)
+
+    def insertRange(self, position: int, array: bytes) -> bool:
         if 0 <= position <= self.size:
-            if position == self.size and self.size == 0:
-                chunkIdx = self.getChunkIndex(position) # to insert before the last byte ??? position-1
-            elif position == self.size:
-                chunkIdx = self.getChunkIndex(position-1)
-            else:
-                chunkIdx = self.getChunkIndex(position)
-            posInBa = position - self.chunks[chunkIdx].absPos
-            self.chunks[chunkIdx].data[posInBa:posInBa] = character[0:1]
-            self.chunks[chunkIdx].dataChanged[posInBa:posInBa] = bytes(HIGHLIGHTED) # to highlight the change
-            for i in range(chunkIdx+1, len(self.chunks)):
-                self.chunks[i].absPos += 1
-            self.size += 1
+            self.pieces.insert(position, array)
+            self.size = self.pieces.size
+            self.version += 1
+            self.markDirty(position, -1)
             self.position = position
             return True
         else:
             return False
 
-    def overwrite(self, position: int, character: bytes) -> bool:
+    def overwriteRange(self, position: int, array: bytes) -> bool:
+        # bytes behind the end of the data are appended
         if 0 <= position < self.size:
-            chunkIdx = self.getChunkIndex(position)
-            posInBa = position - self.chunks[chunkIdx].absPos
-            self.chunks[chunkIdx].data[posInBa:posInBa + 1] = character[0:1]
-            self.chunks[chunkIdx].dataChanged[posInBa:posInBa + 1] = bytes(HIGHLIGHTED) # to highlight the change
+            size = self.size
+            self.pieces.overwrite(position, array)
+            self.size = self.pieces.size
+            self.version += 1
+            self.markDirty(position, position + len(array) if self.size == size else -1)
             self.position = position
             return True
         else:
             return False
 
-    def removeAt(self, position: int) -> bool:
+    def removeRange(self, position: int, length: int) -> bool:
         if 0 <= position < self.size:
-            chunkIdx = self.getChunkIndex(position)
-            posInBa = position - self.chunks[chunkIdx].absPos
-            del self.chunks[chunkIdx].data[posInBa]
-            del self.chunks[chunkIdx].dataChanged[posInBa]
-            for i in range(chunkIdx + 1, len(self.chunks)):
-                self.chunks[i].absPos -= 1
-            self.size -= 1
+            self.pieces.remove(position, min(length, self.size - position))
+            self.size = self.pieces.size
+            self.version += 1
+            self.markDirty(position, -1)
             self.position = position
             return True
         else:
-            return False        
+            return False
+
+    def replaceAll(self, positions, lengths, array: bytes) -> bool:
+        # positions must be sorted and the replaced ranges must not overlap
+        if len(positions) == 0 or positions[0] < 0 or positions[-1] + lengths[-1] > self.size:
+            return False
+        self.pieces.replaceAll(positions, lengths, array)
+        self.size = self.pieces.size
+        self.version += 1
+        sameLength = all(length == len(array) for length in lengths)
+        self.markDirty(positions[0], positions[-1] + lengths[-1] if sameLength else -1)
+        self.position = positions[0]
+        return True
+
+    def state(self):
+        """
+        Returns a snapshot of the edited data, restoreState() brings it back.
+        Snapshots are cheap, they share all unchanged pieces.
+        """
+        return self.pieces.snapshot()
+
+    def restoreState(self, state, position: int, length: int = -1) -> None:
+        # length is the number of bytes the states differ in from position on, -1 if unknown
+        size = self.size
+        self.pieces.restore(state)
+        self.size = self.pieces.size
+        self.version += 1
+        self.markDirty(position, position + length if length >= 0 and self.size == size else -1)
+        self.position = position
+
+    def markDirty(self, begin: int, end: int) -> None:
+        # end -1 means up to the end of the data
+        if self.dirtyBegin < 0:
+            self.dirtyBegin, self.dirtyEnd = begin, end
+        else:
+            self.dirtyEnd = -1 if end < 0 or self.dirtyEnd < 0 else max(end, self.dirtyEnd)
+            self.dirtyBegin = min(begin, self.dirtyBegin)
+
+    def takeDirtyRange(self):
+        # Returns (begin, end) of the bytes changed since the last call or None
+        if self.dirtyBegin < 0:
+            return None
+        dirty = (self.dirtyBegin, self.dirtyEnd)
+        self.dirtyBegin = self.dirtyEnd = -1
+        return dirty
 
     def at(self, pos) -> bytes:
         return bytes(self.data(pos, 1))
@@ -197,35 +484,215 @@ class Chunks(QObject):
     def __getitem__(self, item):
         pass
 
-    def getChunkIndex(self, absPos: int):
-        foundIdx = -1
-        insertIdx = 0
-        ioDelta = 0
-
-        for i in range(len(self.chunks)):
-            chunk = self.chunks[i]
-            # when "undo" and then "redo" the only byte the loop makes a new chunk every "undo-redo"
-            if len(chunk.data) == 0 and len(self.chunks) == 1 and absPos == 0: return 0
-            if chunk.absPos <= absPos < chunk.absPos + len(chunk.data):
-                foundIdx = i
-                break
-            if absPos < chunk.absPos:
-                insertIdx = i
-                break
-            ioDelta += len(chunk.data) - CHUNK_SIZE
-            insertIdx = i + 1
-        
-        if foundIdx == -1:
-            newChunk = Chunk() 
-            readAbsPos = absPos - ioDelta
-            readPos = (readAbsPos >> 12) << 12 # & READ_CHUNK_MASK Q_INT64_C(0xfffffffffffff000)
-            self.device.open(QIODevice.ReadOnly)
-            self.device.seek(readPos)
-            newChunk.data = bytearray(self.device.read(CHUNK_SIZE))
-            self.device.close()
-            newChunk.absPos = absPos - (readAbsPos - readPos)
-            newChunk.dataChanged = bytearray(len(newChunk.data)) #zero filled bytearray
-            self.chunks.insert(insertIdx, newChunk)
-            foundIdx = insertIdx
-        
-        return foundIdx
\ No newline at end of file
+
+class Snapshot:
+    """
+    Read-only view of the edited data of a Chunks object at the time it was
+    taken. The pieces are never changed in place and the add buffer is only
+    appended to, so a snapshot can be read from a worker thread while the
+    data is edited. The device is shared, its reads are serialized by a lock.
+    A snapshot expires when the file is patched in place, see SnapshotReaders.
+    """
+
+    def __init__(self, chunks: Chunks):
+        self.pieces = chunks.pieces.copy()
+        self.size = chunks.size
+        self.device = chunks.device
+        self.deviceLock = chunks.deviceLock
+        self.deviceSize = chunks.deviceSize
+        self.cleanPages = chunks.cleanPages
+        self.mapView = memoryview(chunks.map) if chunks.map is not None else None
+        self.readers = chunks.readers
+        self.generation = chunks.readers.generation
+
+    @contextmanager
+    def reading(self):
+        # Counts the reader while it uses the device or slices of the map
+        self.readers.enter(self.generation)
+        try:
+            yield
+        finally:
+            self.readers.leave()
+
+    def segments(self, position: int, maxSize: int = -1):
+        """
+        Generates (array, changed) for all pieces of the data in the range, see
+        Chunks.segments(). Raises Canceled when the snapshot is expired.
+        """
+        if position >= self.size:
+            return
+        if maxSize < 0:
+            maxSize = self.size
+        if (position + maxSize) > self.size:
+            maxSize = self.size - position
+
+        # not reading() on this path, which the view takes for every frame
+        readers = self.readers
+        readers.enter(self.generation)
+        try:
+            for source, offset, length, changed in self.pieces.pieces(position, maxSize):
+                for ofs in range(offset, offset + length, SEGMENT_SIZE):
+                    if readers.generation != self.generation:
+                        raise Canceled()
+                    count = min(SEGMENT_SIZE, offset + length - ofs)
+                    # original data is read from the map or the device, edited data from the add buffer
+                    if source != ORIGINAL:
+                        yield self.pieces.addBuffer[ofs:ofs + count], changed
+                    elif self.mapView is not None:
+                        yield self.mapView[ofs:ofs + count], changed
+                    elif count < PAGE_SIZE:
+                        yield self.readPages(ofs, count), changed
+                    else:
+                        yield self.readDevice(ofs, count), changed
+        finally:
+            readers.leave()
+
+    def write(self, device: QIODevice, position: int = 0, count: int = -1):
+        """
+        Writes count bytes from position on into the open device, as a job of
+        a Worker, see Chunks.write(). Raises OSError if the device cannot be
+        written.
+        """
+        if count < 0 or (position + count) > self.size:
+            count = self.size - position
+        written = 0
+        for array, _ in self.segments(position, count):
+            block = bytes(array)
+            if device.write(block) != len(block):
+                raise OSError(device.errorString())
+            written += len(block)
+            yield written, count, None
+
+    def originalData(self, position: int, length: int) -> bytes:
+        if self.mapView is not None:
+            with self.reading():
+                return bytes(self.mapView[position:position + length])
+        return self.readDevice(position, length)
+
+    @stats.timed('device.read', len)
+    def readDevice(self, position: int, length: int) -> bytes:
+        with self.reading(), self.deviceLock:
+            opened = not self.device.isOpen()
+            if opened:
+                self.device.open(QIODevice.ReadOnly)
+            self.device.seek(position)
+            array = self.device.read(length)
+            if opened:
+                self.device.close()
+        return array
+
+    def readPages(self, position: int, length: int) -> bytes:
+        # Reads through the clean pages, missing pages are read whole
+        array = bytearray()
+        for page in range(position - position % PAGE_SIZE, position + length, PAGE_SIZE):
+            data = self.cleanPages.get(page)
+            if data is None:
+                data = bytes(self.readDevice(page, min(PAGE_SIZE, self.deviceSize - page)))
+                self.cleanPages.put(page, data)
+            array += data[max(position - page, 0):position + length - page]
+        return bytes(array)
+
+    def data(self, position: int, maxSize: int = -1) -> bytearray:
+        buffer = bytearray()
+        for array, _ in self.segments(position, maxSize):
+            buffer += array
+        return buffer
+
+
+class SnapshotReaders:
+    """
+    Counts the readers of the snapshots of a Chunks object. expire() ends all
+    snapshots taken so far and waits until their readers are gone, so the
+    file can be patched in place.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition(threading.Lock())
+        self.count = 0
+        self.generation = 0
+
+    def enter(self, generation: int) -> None:
+        # Raises Canceled for the readers of an expired snapshot
+        with self.condition:
+            if generation != self.generation:
+                raise Canceled()
+            self.count += 1
+
+    def leave(self) -> None:
+        with self.condition:
+            self.count -= 1
+            if self.count == 0:
+                self.condition.notify_all()
+
+    def expire(self, timeout: float) -> bool:
+        # Returns False if readers are left after timeout seconds
+        with self.condition:
+            self.generation += 1
+            return self.condition.wait_for(lambda: self.count == 0, timeout)
+
+
+class CleanPages:
+    """
+    Bounded cache of unmodified pages of the devices, by a key of the device
+    and the page address. The least recently used page is dropped when the
+    cache is full, it is read again from the device when it is needed. Edits
+    never touch these pages, they are kept by the storage. The pages are
+    shared by the GUI thread and the snapshots on worker threads, a lock
+    protects them.
+    """
+
+    def __init__(self, capacity: int = CLEAN_PAGES):
+        self.capacity = capacity
+        self.pages = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, key) -> bool:
+        return key in self.pages
+
+    def __len__(self) -> int:
+        return len(self.pages)
+
+    def get(self, key) -> bytes:
+        # Returns None if the page is not cached
+        with self.lock:
+            data = self.pages.get(key)
+            if data is not None:
+                self.pages.move_to_end(key)
+            return data
+
+    def put(self, key, data: bytes) -> None:
+        with self.lock:
+            self.pages[key] = data
+            self.pages.move_to_end(key)
+            while len(self.pages) > self.capacity:
+                self.pages.popitem(last=False)
+
+
+class DevicePages:
+    """
+    The pages of one device in the shared CleanPages, by page address. A
+    new device gets a new DevicePages, the pages of the former one are never
+    found again and leave the cache as the least recently used ones.
+    """
+
+    def __init__(self, shared: CleanPages):
+        self.shared = shared
+
+    def __contains__(self, page: int) -> bool:
+        return (self, page) in self.shared
+
+    def __len__(self) -> int:
+        with self.shared.lock:
+            return sum(1 for owner, _ in self.shared.pages if owner is self)
+
+    def get(self, page: int) -> bytes:
+        return self.shared.get((self, page))
+
+    def put(self, page: int, data: bytes) -> None:
+        self.shared.put((self, page), data)
+
+
+# The clean pages of all documents, so more open files do not need more memory
+sharedPages = CleanPages()
+# The file name of every open map, a map leaves when it is freed
+mappedFiles = weakref.WeakKeyDictionary()
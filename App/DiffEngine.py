@@ -0,0 +1,116 @@
+from array import array as Array
+from bisect import bisect_left, bisect_right
+
+COMPARE_BLOCK = 0x100000
+COMPARE_SUBBLOCK = 0x10000
+# Maps equal bytes, which xor to zero, to 0 and all differing ones to 1
+DIFF_TABLE = bytes([0]) + bytes([1]) * 255
+
+
+class DifferenceIndex:
+    """
+    Sorted ranges of differing bytes, stored in two array('q') of their
+    starts and ends. Ranges are appended in ascending order while the
+    comparison runs, touching ones are joined. Finding the next or previous
+    difference and the ranges of a view are binary searches.
+    """
+
+    def __init__(self):
+        self.starts = Array('q')
+        self.ends = Array('q')
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def clear(self) -> None:
+        self.starts = Array('q')
+        self.ends = Array('q')
+
+    def append(self, starts: Array, ends: Array) -> None:
+        if len(starts) == 0:
+            return
+        if len(self.ends) > 0 and self.ends[-1] == starts[0]:
+            self.ends[-1] = ends[0]
+            starts, ends = starts[1:], ends[1:]
+        self.starts.extend(starts)
+        self.ends.extend(ends)
+
+    def totalBytes(self) -> int:
+        return sum(self.ends) - sum(self.starts)
+
+    def spans(self, begin: int, end: int) -> list:
+        # (begin, end) of the ranges between begin and end, cut to them
+        idx = bisect_right(self.ends, begin)
+        result = []
+        while idx < len(self.starts) and self.starts[idx] < end:
+            result.append((max(self.starts[idx], begin), min(self.ends[idx], end)))
+            idx += 1
+        return result
+
+    def next(self, position: int) -> tuple:
+        # (start, length) of the first range starting behind position, None if there is none
+        idx = bisect_right(self.starts, position)
+        if idx == len(self.starts):
+            return None
+        return self.starts[idx], self.ends[idx] - self.starts[idx]
+
+    def previous(self, position: int) -> tuple:
+        # (start, length) of the last range starting before position, None if there is none
+        idx = bisect_left(self.starts, position)
+        if idx == 0:
+            return None
+        return self.starts[idx - 1], self.ends[idx - 1] - self.starts[idx - 1]
+
+
+def differingRuns(first: bytes, second: bytes, offset: int, starts: Array, ends: Array) -> None:
+    # Appends the runs of differing bytes of two blocks of the same length
+    marks = (int.from_bytes(first, 'big') ^ int.from_bytes(second, 'big')).to_bytes(len(first), 'big')
+    marks = marks.translate(DIFF_TABLE)
+    pos = marks.find(1)
+    while pos >= 0:
+        end = marks.find(0, pos)
+        if end < 0:
+            end = len(marks)
+        starts.append(offset + pos)
+        ends.append(offset + end)
+        pos = marks.find(1, end)
+
+
+def compareData(first, second):
+    """
+    Job of a Worker: compares two snapshots byte by byte at the same
+    positions. Blocks of COMPARE_BLOCK bytes are compared as a whole first,
+    only blocks which differ are looked at in sub-blocks, and only differing
+    sub-blocks are compared byte by byte. Every block yields its differing
+    ranges as (starts, ends). The bytes behind the end of the shorter data
+    are one range.
+    """
+    common = min(first.size, second.size)
+    total = max(first.size, second.size)
+    for position in range(0, common, COMPARE_BLOCK):
+        count = min(COMPARE_BLOCK, common - position)
+        blockFirst = bytes(first.data(position, count))
+        blockSecond = bytes(second.data(position, count))
+        starts, ends = Array('q'), Array('q')
+        if blockFirst != blockSecond:
+            for ofs in range(0, count, COMPARE_SUBBLOCK):
+                subFirst = blockFirst[ofs:ofs + COMPARE_SUBBLOCK]
+                subSecond = blockSecond[ofs:ofs + COMPARE_SUBBLOCK]
+                if subFirst != subSecond:
+                    differingRuns(subFirst, subSecond, position + ofs, starts, ends)
+            joinTouching(starts, ends)
+        yield position + count, total, (starts, ends) if len(starts) > 0 else None
+    if total > common:
+        yield total, total, (Array('q', [common]), Array('q', [total]))
+
+
+def joinTouching(starts: Array, ends: Array) -> None:
+    # Runs split at a sub-block border are joined
+    idx = 1
+    while idx < len(starts):
+        if starts[idx] == ends[idx - 1]:
+            ends[idx - 1] = ends[idx]
+            del starts[idx]
+            del ends[idx]
+        else:
+            idx += 1
@@ -0,0 +1,35 @@
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtCore import QFile, QFileInfo
+from App.QHexEdit import QHexEdit
+
+
+class Document:
+    """
+    One open file of the window: the editor, which has its own Chunks and
+    UndoStack, and the file it shows. An untitled document has no file yet.
+    """
+
+    def __init__(self, parent: QWidget = None):
+        self.hexEdit = QHexEdit(parent)
+        self.file = QFile()
+        self.currentFile = str()
+        self.isUntitled = True
+
+    def isModified(self) -> bool:
+        # The editor counts as modified before its first change, the undo stack tells the edits
+        return not self.hexEdit.undoStack.isClean()
+
+    def name(self) -> str:
+        return 'Untitled' if self.isUntitled else QFileInfo(self.currentFile).fileName()
+
+    def title(self) -> str:
+        return self.name() + ('*' if self.isModified() else '')
+
+    def isPristine(self) -> bool:
+        # An untitled and unmodified document can take a file which is opened
+        return self.isUntitled and not self.isModified()
+
+    def close(self) -> None:
+        self.hexEdit.pageCache.clear()
+        self.hexEdit.undoStack.clear()
+        self.hexEdit.chunks.unmapDevice()
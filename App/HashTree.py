@@ -0,0 +1,225 @@
+import hashlib
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+from App.PieceTable import ORIGINAL
+
+MARKER = b'\x00\x00'
+MIN_LEAF = 0x10000
+MAX_LEAF = 0x100000
+LEAF_CACHE = 0x4000
+# Leaves without a MARKER end where the weighted sum of the last ROLL_WINDOW bytes, permuted by ROLL_TABLE, has
+# its low 16 bits zero. The constants are derived from SHA-256, so the leaves never change between versions.
+ROLL_WINDOW = 16
+ROLL_BLOCK = 0x10000
+ROLL_TABLE = bytes(sorted(range(256), key=lambda value: hashlib.sha256(bytes([value])).digest()))
+ROLL_WEIGHTS = [weight | 1 for weight in hashlib.sha256(b'HashTree.ROLL_WEIGHTS').digest()[:ROLL_WINDOW]]
+# The sums are computed in lanes of 3 bytes, the largest sum, 16 * 255 * 255, fits into them
+ROLL_FACTOR = int.from_bytes(b''.join(weight.to_bytes(3, 'little') for weight in ROLL_WEIGHTS), 'little')
+
+
+def rollingFlags(data: bytes) -> bytes:
+    """
+    One byte per byte of data, zero where the rolling sum of the window
+    ending there allows a cut. Only the flags from ROLL_WINDOW - 1 on see a
+    full window. All sums are computed by one multiplication: every byte
+    gets a lane of its own in a big integer, multiplied by the weights in
+    lanes, every lane of the product holds the sum of its window.
+    """
+    count = len(data)
+    lanes = bytearray(3 * count)
+    lanes[0::3] = data.translate(ROLL_TABLE)
+    sums = (int.from_bytes(lanes, 'little') * ROLL_FACTOR).to_bytes(3 * (count + ROLL_WINDOW), 'little')
+    low = int.from_bytes(sums[0:3 * count:3], 'little') | int.from_bytes(sums[1:3 * count:3], 'little')
+    return low.to_bytes(count, 'little')
+
+
+# Byte values whose runs allow a cut everywhere, the sum is the same for every window of a run
+UNIFORM_CUTS = {value for value in range(256) if rollingFlags(bytes([value]) * ROLL_WINDOW)[-1] == 0}
+
+
+def leafCut(window: bytes) -> int:
+    """
+    Length of the leaf at the start of window, which holds MAX_LEAF bytes or
+    all up to the end of the data if there are less. A leaf ends at the
+    first cut at or after MIN_LEAF, behind a MARKER or where the rolling sum
+    allows one, so a cut only depends on the bytes before it. Returns -1 if
+    there is no cut.
+    """
+    idx = window.find(MARKER, MIN_LEAF)
+    # the rolling sum is only needed before the marker
+    limit = idx + len(MARKER) if idx >= 0 else len(window)
+    cut = rollingCut(memoryview(window)[:limit])
+    if cut >= 0:
+        return cut
+    return limit if idx >= 0 else -1
+
+
+def rollingCut(window) -> int:
+    # The first cut of the rolling sum at or after MIN_LEAF, -1 if there is none
+    start = MIN_LEAF - ROLL_WINDOW
+    if len(window) < MIN_LEAF:
+        return -1
+    value = window[start]
+    if bytes(window[start:]).count(value) == len(window) - start:
+        # a run, padding mostly, is not summed up
+        return MIN_LEAF if value in UNIFORM_CUTS else -1
+    while start + ROLL_WINDOW <= len(window):
+        idx = rollingFlags(bytes(window[start:start + ROLL_BLOCK + ROLL_WINDOW - 1])).find(0, ROLL_WINDOW - 1)
+        if idx >= 0:
+            return start + idx + 1
+        start += ROLL_BLOCK
+    return -1
+
+
+def leafLength(window: bytes) -> int:
+    # Without a cut the leaf ends after MAX_LEAF bytes or at the end of the data
+    cut = leafCut(window)
+    return cut if cut >= 0 else len(window)
+
+
+class HashTree:
+    """
+    Two level hash tree of the edited data: the data is cut into leaves, the
+    root is the SHA-256 of the SHA-256 digests of all leaves.
+
+    The leaves are content defined, a leaf ends where leafLength() says so,
+    which only depends on the bytes of the leaf and on whether the data ends
+    there. The root is therefore the same for the same bytes, whatever edits
+    led to them, and an insert only shifts the leaves behind it instead of
+    changing them. Data without markers, text for example, is cut by a
+    rolling sum. Long runs of one byte value have no content to cut at, the
+    leaves of a run behind an insert stay shifted; their digests only
+    depend on the byte value and the length and are cached as such, so the
+    run is read again but not hashed.
+
+    The leaves of the original device are hashed once by update(). Later
+    updates walk the pieces of the edited data: wherever an original leaf
+    starts at a leaf boundary and lies inside of one original piece, its
+    digest is taken as it is. Only the leaves around the edits are read and
+    hashed, their digests are cached by the pieces they are made of, so undo
+    and redo need no hashing at all. The leaves which are not among the
+    original ones tell the regions that differ from the original.
+
+    Only one update runs at a time, the caches belong to it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Leaves of the device: device offsets, end offsets and digests
+        self.starts = None
+        self.ends = []
+        self.digests = []
+        self.originalDigests = set()
+        # The last leaf ends with the device instead of a MARKER or MAX_LEAF
+        self.lastLeafOpen = False
+        self.cache = OrderedDict()
+        self.uniformDigests = {} # by (byte value, length) of leaves of one byte value
+        self.state = None
+        self.result = None
+
+    def update(self, snapshot):
+        """
+        Job of a Worker. Brings the tree up to the edited data of the
+        snapshot, the last item carries (root, leaves, regions, rehashed): the
+        hex digest of the root, the number of leaves, (position, length) of
+        the regions which differ from the original and the number of bytes
+        hashed for this update.
+        """
+        with self.lock:
+            total = snapshot.size + (snapshot.deviceSize if self.starts is None else 0)
+            if self.state is snapshot.pieces.root and self.result is not None:
+                yield total, total, self.result
+                return
+            rehashed = 0
+            if self.starts is None:
+                rehashed = yield from self.hashOriginal(snapshot, total)
+            digests = []
+            regions = []
+            pos = 0
+            size = snapshot.size
+            while pos < size:
+                source, offset, length, _ = next(snapshot.pieces.pieces(pos, size - pos))
+                if source == ORIGINAL:
+                    count = self.originalRun(offset, length, pos + length == size)
+                    if count > 0:
+                        first = bisect_left(self.starts, offset)
+                        digests += self.digests[first:first + count]
+                        pos += self.ends[first + count - 1] - offset
+                        yield total - size + pos, total, None
+                        continue
+                length, digest, hashed = self.editedLeaf(snapshot, pos)
+                rehashed += hashed
+                digests.append(digest)
+                if digest not in self.originalDigests:
+                    if len(regions) > 0 and regions[-1][0] + regions[-1][1] == pos:
+                        regions[-1] = (regions[-1][0], regions[-1][1] + length)
+                    else:
+                        regions.append((pos, length))
+                pos += length
+                yield total - size + pos, total, None
+            self.state = snapshot.pieces.root
+            self.result = (hashlib.sha256(b''.join(digests)).hexdigest(), len(digests), regions, rehashed)
+            yield total, total, self.result
+
+    def hashOriginal(self, snapshot, total: int):
+        # The leaves of the whole device, they are kept only if all of them are hashed. Returns the bytes hashed.
+        starts, ends, digests = [], [], []
+        offset = 0
+        hashed = 0
+        lastOpen = False
+        while offset < snapshot.deviceSize:
+            window = snapshot.originalData(offset, min(MAX_LEAF, snapshot.deviceSize - offset))
+            cut = leafCut(window)
+            length = cut if cut >= 0 else len(window)
+            lastOpen = cut < 0 and len(window) < MAX_LEAF
+            digest, count = self.leafDigest(window, length)
+            starts.append(offset)
+            ends.append(offset + length)
+            digests.append(digest)
+            hashed += count
+            offset += length
+            yield offset, total, None
+        self.starts, self.ends, self.digests = starts, ends, digests
+        self.originalDigests = set(digests)
+        self.lastLeafOpen = lastOpen
+        return hashed
+
+    def leafDigest(self, window: bytes, length: int) -> tuple:
+        # Digest of the first length bytes of window and the number of bytes hashed for it
+        if length > 0 and window.count(window[0], 0, length) == length:
+            key = (window[0], length)
+            digest = self.uniformDigests.get(key)
+            if digest is not None:
+                return digest, 0
+            digest = self.uniformDigests[key] = hashlib.sha256(memoryview(window)[:length]).digest()
+            return digest, length
+        return hashlib.sha256(memoryview(window)[:length]).digest(), length
+
+    def originalRun(self, offset: int, length: int, isLast: bool) -> int:
+        # Number of original leaves from offset on which lie inside of the piece
+        first = bisect_left(self.starts, offset)
+        if first == len(self.starts) or self.starts[first] != offset:
+            return 0
+        last = bisect_right(self.ends, offset + length)
+        if last == len(self.starts) and self.lastLeafOpen and not isLast:
+            # the last leaf of the device would go on with the following bytes
+            last -= 1
+        return max(last - first, 0)
+
+    def editedLeaf(self, snapshot, position: int) -> tuple:
+        # Returns length, digest and the number of bytes hashed of the leaf at position
+        count = min(MAX_LEAF, snapshot.size - position)
+        key = tuple((source, offset, length) for source, offset, length, _ in snapshot.pieces.pieces(position, count))
+        leaf = self.cache.get(key)
+        if leaf is not None:
+            self.cache.move_to_end(key)
+            return leaf + (0,)
+        window = bytes(snapshot.data(position, count))
+        length = leafLength(window)
+        digest, hashed = self.leafDigest(window, length)
+        leaf = self.cache[key] = (length, digest)
+        while len(self.cache) > LEAF_CACHE:
+            self.cache.popitem(last=False)
+        return leaf + (hashed,)
@@ -0,0 +1,61 @@
+import sys
+from bisect import bisect_right
+
+
+class IntervalSet:
+    """
+    Sorted set of disjoint half-open ranges of byte positions.
+
+    The ranges are stored as one flat list of their boundaries, a position
+    is inside of the set if an odd number of boundaries is less than or
+    equal to it. Lookups are binary searches, O(log n) in the number of
+    ranges.
+    """
+
+    def __init__(self):
+        self.bounds = []
+
+    def __bool__(self) -> bool:
+        return len(self.bounds) > 0
+
+    def __iter__(self):
+        # Generates (begin, end) of all ranges
+        return zip(self.bounds[0::2], self.bounds[1::2])
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, IntervalSet) and self.bounds == other.bounds
+
+    def clear(self) -> None:
+        self.bounds.clear()
+
+    def add(self, begin: int, end: int) -> None:
+        # Ranges are added in ascending order, a range touching the last one is joined with it
+        if begin >= end:
+            return
+        if len(self.bounds) > 0 and self.bounds[-1] >= begin:
+            self.bounds[-1] = max(self.bounds[-1], end)
+        else:
+            self.bounds += [begin, end]
+
+    def contains(self, position: int) -> bool:
+        return bisect_right(self.bounds, position) % 2 == 1
+
+    def spans(self, begin: int, end: int) -> list:
+        # Returns (begin, end) of the ranges between begin and end, cut to them
+        idx = bisect_right(self.bounds, begin)
+        if idx % 2 == 1:
+            idx -= 1
+        result = []
+        while idx < len(self.bounds) and self.bounds[idx] < end:
+            result.append((max(self.bounds[idx], begin), min(self.bounds[idx + 1], end)))
+            idx += 2
+        return result
+
+    def replace(self, begin: int, end: int, other: 'IntervalSet') -> None:
+        # Replaces the ranges between begin and end by the ranges of other, end -1 means up to the end
+        if end < 0:
+            end = sys.maxsize
+        result = IntervalSet()
+        for span in self.spans(0, begin) + list(other) + self.spans(end, sys.maxsize):
+            result.add(*span)
+        self.bounds = result.bounds
@@ -0,0 +1,145 @@
+import mmap
+
+from PyQt5.QtCore import QObject
+from PyQt5.QtCore import pyqtSignal as QSignal
+from App.Chunks import Chunks, PAGE_SIZE
+from App.PieceTable import ORIGINAL
+from App.IntervalSet import IntervalSet
+from App.Worker import Worker, INTERACTIVE
+
+READ_AHEAD_PAGES = 2
+
+
+class PageCache(QObject):
+    """
+    Read-ahead cache of the original data for a view, which must never wait
+    for the device.
+
+    The pages of an unmapped device are read on a worker thread into the
+    clean pages of chunks. data() returns the bytes of pages which are not
+    loaded yet as zeros, adds their ranges to the pending ones and queues
+    them, together with the pages above and below the range, which are read
+    ahead. pagesLoaded is emitted for every page that arrives.
+    Edited bytes come from the add buffer and mapped files are read from the
+    map, the kernel is only asked to read ahead there. Only files on local
+    disks are mapped (see Chunks.isLocalDisk()), files on network, FUSE or
+    removable storage go through the worker like any other device.
+    """
+
+    pagesLoaded = QSignal()
+
+    def __init__(self, chunks: Chunks, parent: QObject = None):
+        super().__init__(parent)
+        self.chunks = chunks
+        self.queue = []
+        self.loading = set()
+        self.worker = None
+        self.generation = 0
+
+    def clear(self) -> None:
+        # Pages of a worker started before are dropped when they arrive
+        self.queue = []
+        self.loading.clear()
+        self.generation += 1
+        if self.worker is not None:
+            self.worker.cancel()
+
+    def data(self, position: int, maxSize: int, highlighted: IntervalSet, pending: IntervalSet) -> bytearray:
+        """
+        Like Chunks.data(), but without any read from the device. The ranges
+        of changed bytes are added to highlighted, the ranges of the bytes of
+        pages which are not loaded to pending. These bytes are zero.
+        """
+        buffer = bytearray()
+        chunks = self.chunks
+        if position >= chunks.size or maxSize <= 0:
+            return buffer
+        maxSize = min(maxSize, chunks.size - position)
+        missing = []
+        for source, offset, length, changed in chunks.pieces.pieces(position, maxSize):
+            if changed:
+                highlighted.add(position + len(buffer), position + len(buffer) + length)
+            if source != ORIGINAL:
+                buffer += chunks.pieces.addBuffer[offset:offset + length]
+            elif chunks.mapView is not None:
+                buffer += chunks.mapView[offset:offset + length]
+            else:
+                for page in range(offset - offset % PAGE_SIZE, offset + length, PAGE_SIZE):
+                    lo = max(offset, page)
+                    hi = min(offset + length, page + PAGE_SIZE)
+                    array = chunks.cleanPages.get(page)
+                    if array is None:
+                        missing.append(page)
+                        pending.add(position + len(buffer), position + len(buffer) + hi - lo)
+                        buffer += bytes(hi - lo)
+                        continue
+                    buffer += array[lo - page:hi - page]
+        self.readAhead(position, maxSize, missing)
+        return buffer
+
+    def readAhead(self, position: int, length: int, missing: list) -> None:
+        # The missing pages are read first, then the ones below and above the range
+        ahead = READ_AHEAD_PAGES * PAGE_SIZE
+        wanted = list(dict.fromkeys(missing))
+        urgent = any(page not in self.loading for page in wanted)
+        for page in self.originalPages(position + length, ahead) + \
+                self.originalPages(max(position - ahead, 0), min(position, ahead)):
+            if page not in self.chunks.cleanPages and page not in self.loading and page not in wanted:
+                wanted.append(page)
+        self.load(wanted, urgent)
+
+    def originalPages(self, position: int, length: int) -> list:
+        # Addresses of the device pages behind the range of the edited data
+        pages = []
+        chunks = self.chunks
+        for source, offset, count, _ in chunks.pieces.pieces(position, min(length, chunks.size - position)):
+            if source != ORIGINAL:
+                continue
+            if chunks.map is not None:
+                if hasattr(chunks.map, 'madvise'):
+                    start = offset - offset % mmap.PAGESIZE
+                    chunks.map.madvise(mmap.MADV_WILLNEED, start, offset + count - start)
+                continue
+            pages.extend(range(offset - offset % PAGE_SIZE, offset + count, PAGE_SIZE))
+        return pages
+
+    def load(self, pages: list, urgent: bool = True) -> None:
+        # The pages replace the queued ones. A running worker is stopped after
+        # its current page, if pages which are shown are not among its pages.
+        self.queue = pages
+        if self.worker is None:
+            self.startWorker()
+        elif urgent:
+            self.worker.cancel()
+
+    def startWorker(self) -> None:
+        if len(self.queue) == 0:
+            return
+        self.worker = Worker(self.readPages, self.chunks.snapshot(), self.chunks.deviceSize, self.queue,
+                             self.generation, priority=INTERACTIVE)
+        self.worker.signals.result.connect(self.pageRead)
+        self.worker.signals.finished.connect(self.workerFinished)
+        self.loading = set(self.queue)
+        self.queue = []
+        self.worker.start()
+
+    @staticmethod
+    def readPages(snapshot, size: int, pages: list, generation: int):
+        for done, page in enumerate(pages, 1):
+            yield done, len(pages), (generation, page, snapshot.readDevice(page, min(PAGE_SIZE, size - page)))
+
+    def pageRead(self, result: tuple) -> None:
+        generation, page, array = result
+        if generation != self.generation:
+            return
+        self.loading.discard(page)
+        self.chunks.cleanPages.put(page, bytes(array))
+        if page in self.queue:
+            self.queue.remove(page)
+        # noinspection PyUnresolvedReferences
+        self.pagesLoaded.emit()
+
+    def workerFinished(self, _success: bool) -> None:
+        self.worker = None
+        self.loading.clear()
+        self.startWorker()
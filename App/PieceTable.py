@@ -0,0 +1,322 @@
+import os
+import tempfile
+import threading
+from collections import deque
+from random import random
+from App.Stats import stats
+
+ORIGINAL = 0
+ADD = 1
+SPILL_SIZE = 0x1000000
+
+
+class Piece:
+    """
+    Node of the piece tree.
+
+    A piece describes a run of bytes taken either from the original device
+    (ORIGINAL) or from the append-only add buffer (ADD). The nodes form a treap
+    ordered by position in the edited data: every node caches the byte size of
+    its subtree, so positions are found by descending from the root.
+
+    Nodes are never modified once built, every edit copies the path from the
+    root to the touched nodes. An old root therefore stays a valid snapshot of
+    the data at the time it was taken.
+    """
+    __slots__ = ('source', 'offset', 'length', 'changed', 'priority', 'left', 'right', 'size', 'count')
+
+    def __init__(self, source: int, offset: int, length: int, changed: bool, priority: float,
+                 left: 'Piece' = None, right: 'Piece' = None):
+        self.source = source
+        self.offset = offset
+        self.length = length
+        self.changed = changed
+        self.priority = priority
+        self.left = left
+        self.right = right
+        self.size = length
+        self.count = 1
+        if left is not None:
+            self.size += left.size
+            self.count += left.count
+        if right is not None:
+            self.size += right.size
+            self.count += right.count
+
+    def copy(self, left: 'Piece', right: 'Piece') -> 'Piece':
+        return Piece(self.source, self.offset, self.length, self.changed, self.priority, left, right)
+
+
+def split(node: Piece, position: int) -> tuple:
+    # Returns two trees, the first one holds the bytes before position
+    if node is None:
+        return None, None
+    leftSize = node.left.size if node.left is not None else 0
+    if position <= leftSize:
+        left, right = split(node.left, position)
+        return left, node.copy(right, node.right)
+    if position >= leftSize + node.length:
+        left, right = split(node.right, position - leftSize - node.length)
+        return node.copy(node.left, left), right
+    # position is inside of this piece, cut it in two. The second half gets a
+    # priority of its own, halves sharing one priority would degrade to a list.
+    posInPiece = position - leftSize
+    left = Piece(node.source, node.offset, posInPiece, node.changed, node.priority, node.left, None)
+    right = Piece(node.source, node.offset + posInPiece, node.length - posInPiece, node.changed, random())
+    return left, merge(right, node.right)
+
+
+def merge(left: Piece, right: Piece) -> Piece:
+    # All bytes of left are placed before the bytes of right
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        return left.copy(left.left, merge(left.right, right))
+    return right.copy(merge(left, right.left), right.right)
+
+
+def extendLast(node: Piece, delta: int) -> Piece:
+    # Grows the last piece of the tree by delta bytes
+    if node.right is not None:
+        return node.copy(node.left, extendLast(node.right, delta))
+    return Piece(node.source, node.offset, node.length + delta, node.changed, node.priority, node.left, None)
+
+
+def lastPiece(node: Piece) -> Piece:
+    while node.right is not None:
+        node = node.right
+    return node
+
+
+def setChangedAll(node: Piece, changed: bool) -> Piece:
+    if node is None:
+        return None
+    return Piece(node.source, node.offset, node.length, changed, node.priority,
+                 setChangedAll(node.left, changed), setChangedAll(node.right, changed))
+
+
+def build(pieces: list) -> Piece:
+    # Builds a balanced tree of (source, offset, length, changed) pieces in O(n).
+    # The priorities are handed out level by level in decreasing order, so the
+    # heap order of the treap holds.
+    priorities = sorted((random() for _ in pieces), reverse=True)
+    nodePriority = [0.0] * len(pieces)
+    ranges = deque([(0, len(pieces))])
+    idx = 0
+    while ranges:
+        lo, hi = ranges.popleft()
+        if lo < hi:
+            mid = (lo + hi) // 2
+            nodePriority[mid] = priorities[idx]
+            idx += 1
+            ranges.append((lo, mid))
+            ranges.append((mid + 1, hi))
+
+    def make(lo: int, hi: int) -> Piece:
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        source, offset, length, changed = pieces[mid]
+        return Piece(source, offset, length, changed, nodePriority[mid], make(lo, mid), make(mid + 1, hi))
+
+    return make(0, len(pieces))
+
+
+class AddBuffer:
+    """
+    Append-only buffer of the inserted and overwritten bytes. They are also
+    the data that undo and redo go back to, so the buffer is never shrunk.
+
+    If spillSize is not None, the bytes are moved into an append-only
+    temporary file whenever more than spillSize bytes are in memory, and
+    read back on demand. Memory use is then bounded, however much data is
+    edited. Snapshots read the buffer from worker threads, the reads of the
+    file and the spilling are serialized by a lock.
+    """
+
+    def __init__(self, spillSize: int = SPILL_SIZE):
+        self.spillSize = spillSize
+        self.file = None
+        self.fileSize = 0 # the bytes in memory follow the bytes in the file
+        self.tail = bytearray()
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.fileSize + len(self.tail)
+
+    def __iadd__(self, data: bytes) -> 'AddBuffer':
+        if self.spillSize is not None and len(self.tail) + len(data) > self.spillSize:
+            self.spill(data)
+        else:
+            self.tail += data
+        return self
+
+    def spill(self, data: bytes) -> None:
+        with self.lock:
+            if self.file is None:
+                self.file = tempfile.TemporaryFile(prefix='pyhex-')
+            self.file.seek(0, os.SEEK_END)
+            self.file.write(self.tail)
+            self.file.write(data)
+            self.fileSize += len(self.tail) + len(data)
+            self.tail = bytearray()
+
+    def __getitem__(self, item: slice) -> bytes:
+        with self.lock:
+            start, stop, _ = item.indices(len(self))
+            if start >= self.fileSize:
+                return self.tail[start - self.fileSize:stop - self.fileSize]
+            self.file.seek(start)
+            array = self.file.read(min(stop, self.fileSize) - start)
+            if stop > self.fileSize:
+                array += self.tail[:stop - self.fileSize]
+            return array
+
+
+class PieceTable:
+    """
+    Storage of the edited data as a balanced piece table.
+
+    The data is a sequence of pieces which point either into the original
+    device or into the add buffer, where all inserted and overwritten bytes are
+    appended. Insert, remove, overwrite and position lookup are O(log n) in the
+    number of pieces, independent of the size of the data.
+    """
+
+    def __init__(self, size: int = 0, spillSize: int = SPILL_SIZE):
+        self.addBuffer = AddBuffer(spillSize)
+        self.root = Piece(ORIGINAL, 0, size, False, random()) if size > 0 else None
+
+    @property
+    def size(self) -> int:
+        return self.root.size if self.root is not None else 0
+
+    @property
+    def count(self) -> int:
+        return self.root.count if self.root is not None else 0
+
+    def snapshot(self) -> Piece:
+        # pieces are never changed in place, the root is a snapshot of the data
+        return self.root
+
+    def restore(self, snapshot: Piece) -> None:
+        self.root = snapshot
+
+    def copy(self) -> 'PieceTable':
+        # The copy shares the pieces and the add buffer, which are only appended to
+        table = PieceTable(spillSize=None)
+        table.addBuffer = self.addBuffer
+        table.root = self.root
+        return table
+
+    def append(self, data: bytes) -> Piece:
+        offset = len(self.addBuffer)
+        self.addBuffer += data
+        return Piece(ADD, offset, len(data), True, random())
+
+    def insert(self, position: int, data: bytes) -> None:
+        if len(data) == 0:
+            return
+        left, right = split(self.root, position)
+        piece = self.append(data)
+        if left is not None:
+            last = lastPiece(left)
+            # typing appends to the add buffer, continue the last piece if possible
+            if last.source == ADD and last.changed and last.offset + last.length == piece.offset:
+                self.root = merge(extendLast(left, piece.length), right)
+                return
+        self.root = merge(merge(left, piece), right)
+
+    def remove(self, position: int, length: int) -> None:
+        left, rest = split(self.root, position)
+        _, right = split(rest, length)
+        self.root = merge(left, right)
+
+    def overwrite(self, position: int, data: bytes) -> None:
+        left, rest = split(self.root, position)
+        _, right = split(rest, len(data))
+        self.root = merge(merge(left, self.append(data)), right)
+
+    def replaceAll(self, positions, lengths, data: bytes) -> None:
+        """
+        Replaces lengths[i] bytes at positions[i] by data. The tree is rebuilt
+        in one pass over the pieces, all replacements share one copy of data
+        in the add buffer. positions must be sorted and must not overlap.
+        """
+        replacement = self.append(data)
+        pieces = []
+
+        def add(source: int, offset: int, count: int, changed: bool) -> None:
+            if len(pieces) > 0:
+                lastSource, lastOffset, lastCount, lastChanged = pieces[-1]
+                if lastSource == source and lastChanged == changed and lastOffset + lastCount == offset:
+                    pieces[-1] = (source, lastOffset, lastCount + count, changed)
+                    return
+            pieces.append((source, offset, count, changed))
+
+        position = 0
+        idx = 0
+        remaining = 0 # bytes of the current replaced range still to skip
+        for source, offset, count, changed in self.pieces(0, self.size):
+            while count > 0:
+                if remaining == 0 and idx < len(positions) and position == positions[idx]:
+                    if replacement.length > 0:
+                        add(ADD, replacement.offset, replacement.length, True)
+                    remaining = lengths[idx]
+                    idx += 1
+                if remaining > 0:
+                    step = min(count, remaining)
+                    remaining -= step
+                else:
+                    step = count if idx >= len(positions) else min(count, positions[idx] - position)
+                    add(source, offset, step, changed)
+                position += step
+                offset += step
+                count -= step
+        self.root = build(pieces)
+
+    def setChanged(self, position: int, length: int, changed: bool) -> None:
+        left, rest = split(self.root, position)
+        middle, right = split(rest, length)
+        self.root = merge(merge(left, setChangedAll(middle, changed)), right)
+
+    def pieces(self, position: int, length: int):
+        """
+        Generates (source, offset, length, changed) for every piece inside the
+        range, the first and the last one are cut to the range borders.
+        """
+        if stats.enabled:
+            stats.record('PieceTable.pieces')
+        end = position + length
+        stack = []
+        node = self.root
+        base = 0
+        # descend to the piece that holds position
+        while node is not None:
+            pieceStart = base + (node.left.size if node.left is not None else 0)
+            if position < pieceStart:
+                stack.append((node, pieceStart))
+                node = node.left
+            elif position < pieceStart + node.length:
+                stack.append((node, pieceStart))
+                node = None
+            else:
+                base = pieceStart + node.length
+                node = node.right
+        # in-order walk from there on
+        while stack:
+            node, pieceStart = stack.pop()
+            if pieceStart >= end:
+                break
+            lo = max(position, pieceStart)
+            hi = min(end, pieceStart + node.length)
+            if lo < hi:
+                yield node.source, node.offset + lo - pieceStart, hi - lo, node.changed
+            base = pieceStart + node.length
+            node = node.right
+            while node is not None:
+                pieceStart = base + (node.left.size if node.left is not None else 0)
+                stack.append((node, pieceStart))
+                node = node.left
@@ -4,9 +4,16 @@ from PyQt5.QtGui import QColor, QFont, QResizeEvent, QPaintEvent, QMouseEvent, Q
 from PyQt5.QtCore import QIODevice, QPoint, QRect, Qt, QTimer
 from PyQt5.QtCore import pyqtSignal as QSignal
 from App.Chunks import Chunks
+from App.PageCache import PageCache
+from App.IntervalSet import IntervalSet
 from App.UndoStack import UndoStack
+from App.BytePattern import BytePattern
+from App.Readable import toAscii, readableText, readableBlocks
+from App.Stats import stats
 import math, sys
 
+ROW_CACHE_SIZE = 1024
+
 
 class QHexEdit(QAbstractScrollArea):
     """
@@ -178,6 +185,12 @@ class QHexEdit(QAbstractScrollArea):
         IODevice based access to data.
         """
 
+        self.pageCache = PageCache(self.chunks, self)
+        """
+        The shown data is read through the page cache, which reads the device
+        on a worker thread.
+        """
+
         self.__font = QFont()
         """
         Set the font of the widget. Please use fixed width fonts like Mono or Courier.
@@ -203,8 +216,24 @@ class QHexEdit(QAbstractScrollArea):
         self.dataShown = bytearray()
         self.brushSelection = QBrush()
         self.hexDataShow = str()
-        self.markedShown = bytearray()
+        self.highlightShown = IntervalSet()
+        self.pendingShown = IntervalSet()
+        """
+        Ranges of the changed bytes and of the bytes which are still read from
+        the device in the shown data, by their position in chunks.
+        """
+        self.marks = None
+        """
+        More ranges to highlight, like the differences of a comparison: any
+        object with spans(begin, end) as IntervalSet has.
+        """
         self.brushHighlighted = QBrush()
+        self.rowCache = {}
+        self.rowCacheKey = None
+        """
+        Hex and ascii text of the rows, by row address. The cache is valid for
+        the content version of chunks, bytesPerLine and hexCaps in rowCacheKey.
+        """
 
         self.highlightingColor = QColor(0xff, 0xff, 0x99, 0xff)
         self.brushHighlighted.setColor(self.highlightingColor)
@@ -238,6 +267,8 @@ class QHexEdit(QAbstractScrollArea):
         self.horizontalScrollBar().valueChanged.connect(self.adjust)
 
         self.undoStack.indexChanged.connect(self.dataChangedPrivate)
+        self.undoStack.cleanChanged.connect(self.dataChangedPrivate)
+        self.pageCache.pagesLoaded.connect(self.showLoadedPages)
 
         self.setFont(QFont("Monospace", 12))
 
@@ -310,7 +341,8 @@ class QHexEdit(QAbstractScrollArea):
         
         # 1. delete old cursor
         self.blink = False
-        self.viewport().update()
+        oldRow = self.pxCursorY // self.pxCharHeight - 1 if self.pxCharHeight > 0 else 0
+        self.updateRows(oldRow, oldRow)
 
         # 2. Check, if cursor in range?
         if position > (self.chunks.size * 2 - 1):
@@ -364,6 +396,7 @@ class QHexEdit(QAbstractScrollArea):
 
     def setDataDevice(self, device: QIODevice) -> bool:
         status = self.chunks.setIODevice(device)
+        self.pageCache.clear()
         self.dataChangedPrivate()
         self.viewport().update()
         return status
@@ -384,6 +417,12 @@ class QHexEdit(QAbstractScrollArea):
         self.undoStack.overwrite(index, array)
         self.refresh()
 
+    def replaceAll(self, positions, lengths, array: bytes) -> None:
+        # Replaces the matches at the sorted positions as one undo step
+        self.undoStack.replaceAll(positions, lengths, array)
+        self.setCursorPosition(self.chunks.getPos() * 2)
+        self.refresh()
+
     def ensureVisible(self) -> None:
         if self.cursorPosition <= self.bPosFirst * 2:
             self.verticalScrollBar().setValue(int(self.cursorPosition / 2 / self.bytesPerLine))
@@ -393,18 +432,34 @@ class QHexEdit(QAbstractScrollArea):
             self.horizontalScrollBar().setValue(self.pxCursorX)
         if self.pxCursorX + self.pxCharWidth > self.horizontalScrollBar().value() + self.viewport().width():
             self.horizontalScrollBar().setValue(self.pxCursorX + self.pxCharWidth - self.viewport().width())
-        self.viewport().update()
 
     def indexOf(self, array: bytes, _from: int) -> int:
         pos = self.chunks.indexOf(array, _from)
         if pos > -1:
-            curPos = pos*2
-            self.setCursorPosition(curPos + len(array)*2)
-            self.resetSelection(curPos)
-            self.setSelection(curPos + len(array)*2)
-            self.ensureVisible()
+            self.selectRange(pos, len(array))
         return pos
 
+    def selectRange(self, position: int, length: int) -> None:
+        # Selects the bytes and puts the cursor behind them
+        curPos = position*2
+        self.setCursorPosition(curPos + length*2)
+        self.resetSelection(curPos)
+        self.setSelection(curPos + length*2)
+        self.ensureVisible()
+
+    def findPattern(self, pattern: BytePattern, _from: int, backwards: bool = False) -> tuple:
+        # Selects the next match and returns its position and length, searching backwards the cursor is put before it
+        if backwards:
+            pos, length = self.chunks.searchBackwards(pattern, _from)
+            if pos > -1:
+                self.selectRange(pos, length)
+                self.setCursorPosition(pos*2 - 1)
+        else:
+            pos, length = self.chunks.search(pattern, _from)
+            if pos > -1:
+                self.selectRange(pos, length)
+        return pos, length
+
     def isModified(self) -> bool:
         return self.modified
 
@@ -424,8 +479,7 @@ class QHexEdit(QAbstractScrollArea):
         self.refresh()
 
     def selectionToReadableString(self) -> str:
-        ba = self.chunks.data(self.getSelectionBegin(), self.getSelectionEnd() - self.getSelectionBegin())
-        return self.toReadable(ba)
+        return ''.join(text for _, text in self.toReadableBlocks(True))
 
     def selectedData(self) -> str:
         pass
@@ -445,8 +499,22 @@ class QHexEdit(QAbstractScrollArea):
         self.viewport().update()
 
     def toReadableString(self) -> str:
-        ba = self.chunks.data(0, -1)
-        return self.toReadable(ba)
+        return ''.join(text for _, text in self.toReadableBlocks())
+
+    def toReadableBlocks(self, selection: bool = False):
+        """
+        Generates (done, text) for the readable text of the data or of the
+        selection, with the addresses and the bytes per line of the view, see
+        App.Readable.readableBlocks(). The data is read from a snapshot, so the
+        blocks can be generated on a worker thread.
+        """
+        if selection:
+            position, length = self.getSelectionBegin(), self.getSelectionEnd() - self.getSelectionBegin()
+        else:
+            position, length = 0, self.chunks.size
+        address = self.addressOffset + position
+        return readableBlocks(self.chunks.snapshot(), position, length, address,
+                              self.calcAddrDigits(address + length), self.bytesPerLine)
 
     def undo(self) -> None:
         self.undoStack.undo()
@@ -673,7 +741,7 @@ class QHexEdit(QAbstractScrollArea):
                             length = self.getSelectionEnd() - self.getSelectionBegin()
                             self.replace(self.getSelectionBegin(), bytes(length)) # zero filled bytes
                         else:
-                            self.remove(self.getSelectionBegin(), self.getSelectionEnd - self.getSelectionBegin())
+                            self.remove(self.getSelectionBegin(), self.getSelectionEnd() - self.getSelectionBegin())
                             self.bPosCurrent = self.getSelectionBegin()
                         self.setCursorPosition(2 * self.bPosCurrent)
                         self.resetSelection(2 * self.bPosCurrent)
@@ -710,7 +778,6 @@ class QHexEdit(QAbstractScrollArea):
 
     def mouseMoveEvent(self, event: QMouseEvent) -> None:
         self.blink = False
-        self.viewport().update()
         actPos = self.getCursorPosition(event.pos())
         if actPos >= 0:
             self.setCursorPosition(actPos)
@@ -718,13 +785,13 @@ class QHexEdit(QAbstractScrollArea):
 
     def mousePressEvent(self, event: QMouseEvent) -> None:
         self.blink = False
-        self.viewport().update()
         cPos = self.getCursorPosition(event.pos())
         if cPos >= 0:
             if event.button() != Qt.RightButton:
                 self.resetSelection(cPos)
             self.setCursorPosition(cPos)
 
+    @stats.timed('QHexEdit.paintEvent')
     def paintEvent(self, event: QPaintEvent) -> None:
         painter = QPainter(self.viewport())
         pxOffsetX = self.horizontalScrollBar().value()
@@ -744,52 +811,49 @@ class QHexEdit(QAbstractScrollArea):
                 painter.setPen(Qt.gray)
                 painter.drawLine(linePos - pxOffsetX, event.rect().top(), linePos - pxOffsetX, self.height())
             painter.setPen(self.viewport().palette().color(QPalette.WindowText))
+            rows = self.rowsInRegion(event.region())
             if self.addressArea:
-                pxPosY = pxPosStartY
-                for row in range(len(self.dataShown) // self.bytesPerLine):
-                    addrTemplate = self.getAddrTemplate(self.chunks.size)
+                addrTemplate = self.getAddrTemplate(self.chunks.size)
+                for row in rows:
+                    if row * self.bytesPerLine >= len(self.dataShown):
+                        break
                     address = addrTemplate.format(self.bPosFirst + row * self.bytesPerLine + self.addressOffset)
-                    painter.drawText(self.pxPosAdrX - pxOffsetX, pxPosY, address)
-                    pxPosY += self.pxCharHeight
+                    painter.drawText(self.pxPosAdrX - pxOffsetX, pxPosStartY + row * self.pxCharHeight, address)
             colStandard = QPen(self.viewport().palette().color(QPalette.WindowText))
             painter.setBackgroundMode(Qt.TransparentMode)
-            pxPosY = pxPosStartY
-            for row in range(self.rowsShown):
+            for row in rows:
+                pxPosY = pxPosStartY + row * self.pxCharHeight
+                bPosLine = row * self.bytesPerLine
+                rowData = self.dataShown[bPosLine:bPosLine + self.bytesPerLine]
+                if len(rowData) == 0:
+                    break
+                rowStart = self.bPosFirst + bPosLine
+                if self.pendingShown.spans(rowStart, rowStart + len(rowData)):
+                    hexText, asciiText = self.placeholderText(rowStart, rowData)
+                else:
+                    hexText, asciiText = self.rowText(rowStart, rowData)
                 pxPosX = self.pxPosHexX - pxOffsetX
                 pxPosAsciiX = self.pxPosAsciiX - pxOffsetX
-                bPosLine = row * self.bytesPerLine
-                colIdx = 0
-                while (bPosLine + colIdx) < len(self.dataShown) and colIdx < self.bytesPerLine:
-                    c = self.viewport().palette().color(QPalette.Base)
-                    painter.setPen(colStandard)
-                    posBa = self.bPosFirst + bPosLine + colIdx
-                    if self.getSelectionBegin() <= posBa < self.getSelectionEnd():
-                        c = self.brushSelection.color()
-                        painter.setPen(self.penSelection)
-                    elif self.highlighting:
-                        if self.markedShown[posBa - self.bPosFirst]:
-                            c = self.brushHighlighted.color()
-                            painter.setPen(self.penHighlighted)
-                    r = QRect()
-                    if colIdx == 0:
-                        r.setRect(pxPosX, pxPosY - self.pxCharHeight + self.pxSelectionSub, 2 * self.pxCharWidth,
-                                  self.pxCharHeight)
-                    else:
-                        r.setRect(pxPosX - self.pxCharWidth, pxPosY - self.pxCharHeight + self.pxSelectionSub,
-                                  3 * self.pxCharWidth, self.pxCharHeight)
-                    painter.fillRect(r, c)
-                    hex = self.hexDataShow[(bPosLine + colIdx) * 2:(bPosLine + colIdx) * 2 + 2]
-                    painter.drawText(pxPosX, pxPosY, hex.upper() if self.hexCaps else hex)
-                    pxPosX += 3 * self.pxCharWidth
+                pxTop = pxPosY - self.pxCharHeight + self.pxSelectionSub
+                # Runs of bytes with the same state are filled and drawn at once
+                col = 0
+                for state, count in self.rowRuns(rowStart, len(rowData)):
+                    pen, color = ((self.penSelection, self.brushSelection.color()) if state == 2 else
+                                  (self.penHighlighted, self.brushHighlighted.color()) if state == 1 else
+                                  (colStandard, None))
+                    if color is not None:
+                        left = pxPosX + col * 3 * self.pxCharWidth - (self.pxCharWidth if col > 0 else 0)
+                        right = pxPosX + (col + count - 1) * 3 * self.pxCharWidth + 2 * self.pxCharWidth
+                        painter.fillRect(QRect(left, pxTop, right - left, self.pxCharHeight), color)
+                    painter.setPen(pen)
+                    painter.drawText(pxPosX + col * 3 * self.pxCharWidth, pxPosY,
+                                     hexText[col * 3:(col + count) * 3 - 1])
                     if self.asciiArea:
-                        ch = self.bytesToStr(self.dataShown[bPosLine+colIdx:bPosLine+colIdx+1])
-                        r.setRect(pxPosAsciiX, pxPosY - self.pxCharHeight + self.pxSelectionSub, self.pxCharWidth,
-                                  self.pxCharHeight)
-                        painter.fillRect(r, c)
-                        painter.drawText(pxPosAsciiX, pxPosY, ch)
-                        pxPosAsciiX += self.pxCharWidth
-                    colIdx += 1
-                pxPosY += self.pxCharHeight
+                        if color is not None:
+                            painter.fillRect(QRect(pxPosAsciiX + col * self.pxCharWidth, pxTop,
+                                                   count * self.pxCharWidth, self.pxCharHeight), color)
+                        painter.drawText(pxPosAsciiX + col * self.pxCharWidth, pxPosY, asciiText[col:col + count])
+                    col += count
             painter.setBackgroundMode(Qt.TransparentMode)
             painter.setPen(self.viewport().palette().color(QPalette.WindowText))
 
@@ -851,18 +915,30 @@ class QHexEdit(QAbstractScrollArea):
         pos = pos // 2
         if pos < 0: pos = 0
         if pos > self.chunks.size: pos = self.chunks.size
+        self.updateSelection(pos, pos)
         self.bSelectionInit = pos
-        self.bSelectionBegin = pos
-        self.bSelectionEnd = pos
 
     def setSelection(self, pos: int) -> None:
         pos = pos // 2
         if pos < 0: pos = 0
         if pos > self.chunks.size: pos = self.chunks.size
         if pos >= self.bSelectionInit:
-            self.bSelectionBegin, self.bSelectionEnd = self.bSelectionInit, pos
+            self.updateSelection(self.bSelectionInit, pos)
         else:
-            self.bSelectionBegin, self.bSelectionEnd = pos, self.bSelectionInit
+            self.updateSelection(pos, self.bSelectionInit)
+
+    def updateSelection(self, begin: int, end: int) -> None:
+        # Only the rows where the old and the new selection differ are repainted
+        oldBegin, oldEnd = self.bSelectionBegin, self.bSelectionEnd
+        self.bSelectionBegin, self.bSelectionEnd = begin, end
+        if oldBegin == oldEnd and begin == end:
+            return
+        if oldBegin >= oldEnd or begin >= end or oldEnd <= begin or end <= oldBegin:
+            self.updateRange(oldBegin, oldEnd)
+            self.updateRange(begin, end)
+        else:
+            self.updateRange(min(oldBegin, begin), max(oldBegin, begin))
+            self.updateRange(min(oldEnd, end), max(oldEnd, end))
 
     def getSelectionBegin(self) -> int:
         return self.bSelectionBegin
@@ -871,6 +947,12 @@ class QHexEdit(QAbstractScrollArea):
         return self.bSelectionEnd
 
     def adjust(self) -> None:
+        self.adjustLayout()
+        self.readBuffers()
+        self.viewport().update()
+        self.setCursorPosition(self.cursorPosition)
+
+    def adjustLayout(self) -> None:
         if self.addressArea:
             # The addressDigit is the total of digits that is used for represent the directions of memory
             # Old called to method: getAddressDigit()
@@ -899,35 +981,144 @@ class QHexEdit(QAbstractScrollArea):
         self.bPosLast = self.bPosFirst + (self.rowsShown * self.bytesPerLine) - 1
         if self.bPosLast >= self.chunks.getSize():
             self.bPosLast = self.chunks.getSize() - 1
-        self.readBuffers()
-        self.setCursorPosition(self.cursorPosition)
 
     # noinspection PyUnresolvedReferences
     def dataChangedPrivate(self) -> None:
-        self.modified = self.undoStack.index() != 0
-        self.adjust()
+        self.modified = not self.undoStack.isClean()
+        dirty = self.chunks.takeDirtyRange()
+        layout = (self.pxPosHexX, self.bPosFirst)
+        self.adjustLayout()
+        if layout != (self.pxPosHexX, self.bPosFirst):
+            self.readBuffers()
+            self.viewport().update()
+        elif dirty is not None:
+            self.readRange(*dirty)
+        self.setCursorPosition(self.cursorPosition)
         self.dataChanged.emit()
 
     def refresh(self) -> None:
+        # Changed data is re-read by dataChangedPrivate(), here the cursor is only kept visible
         self.ensureVisible()
-        self.readBuffers()
 
+    @stats.timed('QHexEdit.readBuffers')
     def readBuffers(self) -> None:
-        self.dataShown = self.chunks.data(self.bPosFirst, self.bPosLast - self.bPosFirst + self.bytesPerLine + 1,
-                                          self.markedShown)
+        self.highlightShown = IntervalSet()
+        self.pendingShown = IntervalSet()
+        self.dataShown = self.pageCache.data(self.bPosFirst, self.bPosLast - self.bPosFirst + self.bytesPerLine + 1,
+                                             self.highlightShown, self.pendingShown)
         self.hexDataShow = self.dataShown.hex()
 
+    def rowsInRegion(self, region) -> list:
+        # Rows to draw for a paint event, a row reaches from its top into the next row
+        rows = set()
+        for rect in region.rects():
+            first = max(rect.top() // self.pxCharHeight - 1, 0)
+            last = min(rect.bottom() // self.pxCharHeight, self.rowsShown - 1)
+            rows.update(range(first, last + 1))
+        return sorted(rows)
+
+    def readRange(self, begin: int, end: int) -> None:
+        # Re-reads the shown bytes of the range and repaints their rows, end -1 means up to the end
+        viewEnd = self.bPosLast + self.bytesPerLine + 1
+        begin = max(begin, self.bPosFirst)
+        begin -= (begin - self.bPosFirst) % self.bytesPerLine
+        stop = viewEnd if end < 0 else min(end, viewEnd)
+        if begin >= stop and end >= 0:
+            return
+        highlighted = IntervalSet()
+        pending = IntervalSet()
+        data = self.pageCache.data(begin, max(stop - begin, 0), highlighted, pending)
+        offset = begin - self.bPosFirst
+        if end < 0:
+            self.dataShown[offset:] = data
+        else:
+            self.dataShown[offset:offset + stop - begin] = data
+        self.highlightShown.replace(begin, stop if end >= 0 else -1, highlighted)
+        self.pendingShown.replace(begin, stop if end >= 0 else -1, pending)
+        self.hexDataShow = self.dataShown.hex()
+        self.updateRange(begin, stop if end >= 0 else -1)
+
+    def showLoadedPages(self) -> None:
+        # Re-reads the bytes which were shown as placeholders
+        if self.pendingShown:
+            self.readRange(self.pendingShown.bounds[0], self.pendingShown.bounds[-1])
+
+    def updateRange(self, begin: int, end: int) -> None:
+        # Repaints the rows of the bytes from begin to end, end -1 means up to the last row
+        if end >= 0 and end <= begin:
+            return
+        firstRow = (begin - self.bPosFirst) // self.bytesPerLine
+        lastRow = self.rowsShown if end < 0 else (end - 1 - self.bPosFirst) // self.bytesPerLine
+        self.updateRows(firstRow, lastRow)
+
+    def updateRows(self, firstRow: int, lastRow: int) -> None:
+        firstRow = max(firstRow, 0)
+        lastRow = min(lastRow, self.rowsShown)
+        if firstRow <= lastRow:
+            # the descenders of a row reach into the next one
+            self.viewport().update(QRect(0, firstRow * self.pxCharHeight, self.viewport().width(),
+                                         (lastRow - firstRow + 2) * self.pxCharHeight))
+
+    def rowText(self, address: int, rowData: bytes) -> tuple:
+        # Returns the hex and the ascii text of a row, a space separates the hex bytes
+        key = (self.chunks.version, self.bytesPerLine, self.hexCaps)
+        if key != self.rowCacheKey or len(self.rowCache) >= ROW_CACHE_SIZE:
+            self.rowCache.clear()
+            self.rowCacheKey = key
+        text = self.rowCache.get(address)
+        if text is None:
+            hexText = rowData.hex(' ')
+            text = (hexText.upper() if self.hexCaps else hexText, self.bytesToStr(rowData))
+            self.rowCache[address] = text
+        return text
+
+    def placeholderText(self, rowStart: int, rowData: bytes) -> tuple:
+        # Bytes which are not read yet are shown as '--' and ' '
+        hexText, asciiText = rowData.hex(' '), toAscii(rowData)
+        if self.hexCaps:
+            hexText = hexText.upper()
+        for begin, end in self.pendingShown.spans(rowStart, rowStart + len(rowData)):
+            begin, end = begin - rowStart, end - rowStart
+            hexText = hexText[:begin * 3] + '-- ' * (end - begin) + hexText[end * 3:]
+            asciiText = asciiText[:begin] + ' ' * (end - begin) + asciiText[end:]
+        return hexText[:len(rowData) * 3 - 1], asciiText
+
+    def rowRuns(self, rowStart: int, count: int) -> list:
+        # Runs of (state, length) of the bytes of a row: 2 selected, 1 highlighted, 0 normal
+        rowEnd = rowStart + count
+        selBegin = min(max(self.getSelectionBegin(), rowStart), rowEnd)
+        selEnd = max(min(self.getSelectionEnd(), rowEnd), selBegin)
+        runs = []
+
+        def add(state: int, length: int) -> None:
+            if len(runs) > 0 and runs[-1][0] == state:
+                runs[-1] = (state, runs[-1][1] + length)
+            elif length > 0:
+                runs.append((state, length))
+
+        for begin, end, selected in ((rowStart, selBegin, False), (selBegin, selEnd, True), (selEnd, rowEnd, False)):
+            if selected:
+                add(2, end - begin)
+                continue
+            position = begin
+            for spanBegin, spanEnd in self.highlightedSpans(begin, end) if self.highlighting else []:
+                add(0, spanBegin - position)
+                add(1, spanEnd - spanBegin)
+                position = spanEnd
+            add(0, end - position)
+        return runs
+
+    def highlightedSpans(self, begin: int, end: int) -> list:
+        spans = self.highlightShown.spans(begin, end)
+        if self.marks is None:
+            return spans
+        merged = IntervalSet()
+        for span in sorted(spans + self.marks.spans(begin, end)):
+            merged.add(*span)
+        return list(merged)
+
     def toReadable(self, array: bytearray) -> str:
-        result = str()
-        addrTemplate = self.getAddrTemplate(len(array))
-        for i in range(0, len(array), 16):
-            addString = addrTemplate.format(self.addressOffset + i)
-            ascString = str()
-            hexline = array[i:i+16].hex()
-            hexString = ' '.join([hexline[i:i+2] for i in range(0, len(hexline), 2)] + ['  ']*(16 - len(hexline) // 2))
-            ascString = self.bytesToStr(array[i:i+16])
-            result += addString + '  ' + hexString + '  ' + ascString + '\n'
-        return result
+        return readableText(array, self.addressOffset, self.calcAddrDigits(len(array)), self.bytesPerLine)
 
     def updateCursor(self):
         if self.blink:
@@ -937,16 +1128,11 @@ class QHexEdit(QAbstractScrollArea):
         self.viewport().update(self.cursorRect)
 
     def byteToStr(self, b: bytes) -> str:
-        ch = b.decode(encoding='ascii', errors='ignore')
-        return '.' if ch < ' ' or ch > '~' else ch
+        return toAscii(b[0:1])
 
     def bytesToStr(self, b: bytes) -> str:
-        res = ''
-        for i in range(len(b)):
-            ch = b[i:i+1].decode(encoding='ascii', errors='ignore')
-            res += '.' if ch < ' ' or ch > '~' else ch
-        return res
-    
+        return toAscii(b)
+
     def calcAddrDigits(self, size: int, base: int = 10) -> int:
         res = self.addressWidth
         if size >= 1:
@@ -0,0 +1,81 @@
+# Maps every byte to its character in the ascii area, bytes which are not printable become '.'
+ASCII_TABLE = bytes(b if 0x20 <= b <= 0x7e else ord('.') for b in range(256))
+
+BLOCK_LINES = 0x1000
+
+
+def toAscii(array: bytes) -> str:
+    return bytes(array).translate(ASCII_TABLE).decode('ascii')
+
+
+def readableLine(array: bytes, address: int, digits: int, bytesPerLine: int = 16) -> str:
+    # The hex column of a short line is filled up with spaces
+    hexText = bytes(array).hex(' ')
+    return f"{address:0{digits}d}  {hexText:<{bytesPerLine * 3 - 1}}  {toAscii(array)}\n"
+
+
+def readableText(array: bytes, address: int, digits: int, bytesPerLine: int = 16) -> str:
+    """
+    Formats the bytes as lines of decimal address, hex bytes and ascii
+    characters, the first line starts with address. Addresses have at least
+    digits digits. Blocks of whole lines are built column by column: every
+    column is one slice assignment over all lines of the block, the addresses
+    of a block are formatted by a single % operation.
+    """
+    array = bytes(array)
+    blockSize = BLOCK_LINES * bytesPerLine
+    parts = []
+    for start in range(0, len(array), blockSize):
+        block = array[start:start + blockSize]
+        lines = len(block) // bytesPerLine
+        first = address + start
+        last = first + (lines - 1) * bytesPerLine
+        width = max(digits, len(str(first)))
+        if lines == 0 or len(str(last)) > width:
+            # the address gets one more digit inside of the block
+            parts.extend(readableLine(block[ofs:ofs + bytesPerLine], first + ofs, digits, bytesPerLine)
+                         for ofs in range(0, len(block), bytesPerLine))
+            continue
+        full = lines * bytesPerLine
+        hexPos = width + 2
+        asciiPos = hexPos + bytesPerLine * 3 + 1
+        lineLength = asciiPos + bytesPerLine + 1
+        text = bytearray((b' ' * (lineLength - 1) + b'\n') * lines)
+        addresses = (b'%%0%dd' % width * lines) % tuple(range(first, last + 1, bytesPerLine))
+        for col in range(width):
+            text[col::lineLength] = addresses[col::width]
+        hexDigits = block[:full].hex().encode('ascii')
+        ascii = block[:full].translate(ASCII_TABLE)
+        for col in range(bytesPerLine):
+            text[hexPos + col * 3::lineLength] = hexDigits[col * 2::bytesPerLine * 2]
+            text[hexPos + col * 3 + 1::lineLength] = hexDigits[col * 2 + 1::bytesPerLine * 2]
+            text[asciiPos + col::lineLength] = ascii[col::bytesPerLine]
+        parts.append(text.decode('ascii'))
+        if full < len(block):
+            parts.append(readableLine(block[full:], first + full, digits, bytesPerLine))
+    return ''.join(parts)
+
+
+def readableBlocks(snapshot, position: int, length: int, address: int, digits: int, bytesPerLine: int = 16):
+    """
+    Generates (done, text) for the readable text of length bytes of the
+    snapshot from position on, in blocks of BLOCK_LINES lines. The first line
+    starts with address, done is the number of bytes formatted so far.
+    """
+    blockSize = BLOCK_LINES * bytesPerLine
+    for ofs in range(0, length, blockSize):
+        count = min(blockSize, length - ofs)
+        yield ofs + count, readableText(snapshot.data(position + ofs, count), address + ofs, digits, bytesPerLine)
+
+
+def writeReadable(device, blocks, total: int):
+    """
+    Writes the text of readableBlocks() into the open device, as a job of a
+    Worker. total is the number of bytes of the blocks. Raises OSError if the
+    device cannot be written.
+    """
+    for done, text in blocks:
+        block = text.encode('ascii')
+        if device.write(block) != len(block):
+            raise OSError(device.errorString())
+        yield done, total, None
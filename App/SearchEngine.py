@@ -0,0 +1,249 @@
+import time
+from array import array as Array
+
+from App.BytePattern import BytePattern
+from App.Signatures import Signatures
+
+SEARCH_BUFFER_SIZE = 0x400000
+
+
+class SearchEngine:
+    """
+    Searches byte sequences in the edited data of a Chunks object.
+
+    The data is streamed through one reusable buffer of SEARCH_BUFFER_SIZE
+    bytes, consecutive windows overlap by len(array) - 1 bytes, so matches
+    across the window borders are found. Unmodified ranges of a mapped file
+    are copied straight from the map into the buffer. The search itself is done
+    by bytearray.find() and rfind(), which run in C with memchr based scanning.
+
+    After every search bytesScanned and seconds hold the amount of data looked
+    at and the time it took, throughput() returns the rate in bytes per second.
+    """
+
+    def __init__(self, chunks, bufferSize: int = SEARCH_BUFFER_SIZE):
+        self.chunks = chunks
+        self.bufferSize = bufferSize
+        self.buffer = bytearray()
+        self.bytesScanned = 0
+        self.seconds = 0.0
+
+    def throughput(self) -> float:
+        return self.bytesScanned / self.seconds if self.seconds > 0 else 0.0
+
+    def fill(self, position: int, length: int, keep: int = 0) -> int:
+        # Copies the range behind the first keep bytes of the buffer, returns the bytes in the buffer
+        if len(self.buffer) < keep + length:
+            # grow in place, the kept bytes must survive
+            self.buffer.extend(bytes(keep + length - len(self.buffer)))
+        filled = keep
+        for array, _ in self.chunks.segments(position, length):
+            self.buffer[filled:filled + len(array)] = array
+            filled += len(array)
+        self.bytesScanned += filled - keep
+        return filled
+
+    def windows(self, position: int, end: int, overlap: int):
+        """
+        Generates (windowPos, filled) for the forward windows of the range,
+        the buffer holds filled bytes of data from windowPos on.
+        """
+        keep = 0
+        while position < end:
+            length = min(self.bufferSize, end - position)
+            filled = self.fill(position, length, keep)
+            windowPos = position - keep
+            yield windowPos, filled
+            position += length
+            keep = min(overlap, filled)
+            self.buffer[0:keep] = self.buffer[filled - keep:filled]
+
+    def indexOf(self, array: bytes, _from: int) -> int:
+        res = -1
+        self.bytesScanned = 0
+        start = time.perf_counter()
+        if len(array) > 0:
+            for windowPos, filled in self.windows(max(_from, 0), self.chunks.size, len(array) - 1):
+                findPos = self.buffer.find(array, 0, filled)
+                if findPos >= 0:
+                    res = windowPos + findPos
+                    break
+        self.seconds = time.perf_counter() - start
+        return res
+
+    def lastIndexOf(self, array: bytes, _from: int) -> int:
+        # Finds the last match which ends before _from
+        res = -1
+        self.bytesScanned = 0
+        start = time.perf_counter()
+        end = min(_from, self.chunks.size)
+        if len(array) > 0:
+            while end >= len(array):
+                windowPos = max(end - self.bufferSize - len(array) + 1, 0)
+                filled = self.fill(windowPos, end - windowPos)
+                findPos = self.buffer.rfind(array, 0, filled)
+                if findPos >= 0:
+                    res = windowPos + findPos
+                    break
+                end = windowPos + len(array) - 1
+                if windowPos == 0:
+                    break
+        self.seconds = time.perf_counter() - start
+        return res
+
+    def findAll(self, array: bytes, position: int = 0):
+        """
+        Generates (done, total, matches) for every window of a forward scan
+        from position on. matches is an array('q') with the positions of the
+        matches found in the window or None, done is the position the data is
+        scanned up to. Matches do not overlap, as with repeated indexOf().
+        """
+        self.bytesScanned = 0
+        start = time.perf_counter()
+        end = self.chunks.size
+        nextPos = position
+        if len(array) > 0:
+            for windowPos, filled in self.windows(position, end, len(array) - 1):
+                matches = Array('q')
+                findPos = self.buffer.find(array, max(nextPos - windowPos, 0), filled)
+                while findPos >= 0:
+                    matches.append(windowPos + findPos)
+                    findPos = self.buffer.find(array, findPos + len(array), filled)
+                if len(matches) > 0:
+                    nextPos = matches[-1] + len(array)
+                self.seconds = time.perf_counter() - start
+                yield windowPos + filled, end, matches if len(matches) > 0 else None
+
+    def patternWindows(self, position: int, end: int, overlap: int):
+        """
+        Generates (windowPos, filled, limit) for the forward windows of the
+        range. The buffer holds filled bytes from windowPos on, which include
+        up to overlap bytes behind the window, the window ends at limit.
+        """
+        while position < end:
+            windowEnd = min(position + self.bufferSize, end)
+            filled = self.fill(position, min(windowEnd + overlap, self.chunks.size) - position)
+            yield position, filled, windowEnd - position
+            position = windowEnd
+
+    def search(self, pattern: BytePattern, _from: int) -> tuple:
+        # Returns (position, length) of the first match from _from on, position is -1 if none is found
+        if pattern.literal is not None:
+            return self.indexOf(pattern.literal, _from), pattern.length
+        res = (-1, 0)
+        self.bytesScanned = 0
+        start = time.perf_counter()
+        for windowPos, filled, limit in self.patternWindows(max(_from, 0), self.chunks.size, pattern.maxLength):
+            match = next((m for m in pattern.regex.finditer(self.buffer, 0, filled) if m.end() > m.start()), None)
+            if match is not None and match.start() < limit:
+                res = (windowPos + match.start(), match.end() - match.start())
+                break
+        self.seconds = time.perf_counter() - start
+        return res
+
+    def searchBackwards(self, pattern: BytePattern, _from: int) -> tuple:
+        # Returns (position, length) of the last match which ends before _from
+        if pattern.literal is not None:
+            return self.lastIndexOf(pattern.literal, _from), pattern.length
+        res = (-1, 0)
+        self.bytesScanned = 0
+        start = time.perf_counter()
+        end = min(_from, self.chunks.size)
+        windowEnd = end
+        while windowEnd > 0:
+            windowPos = max(windowEnd - self.bufferSize, 0)
+            filled = self.fill(windowPos, min(windowEnd + pattern.maxLength, end) - windowPos)
+            last = None
+            for match in pattern.regex.finditer(self.buffer, 0, filled):
+                if match.start() >= windowEnd - windowPos:
+                    break
+                if match.end() > match.start():
+                    last = match
+            if last is not None:
+                res = (windowPos + last.start(), last.end() - last.start())
+                break
+            windowEnd = windowPos
+        self.seconds = time.perf_counter() - start
+        return res
+
+    def findMatches(self, pattern: BytePattern, position: int = 0):
+        """
+        Generates (done, total, matches) like findAll(), matches is a tuple
+        (offsets, lengths) of two array('q') or None. lengths is None, if all
+        matches have pattern.length bytes.
+        """
+        if pattern.literal is not None:
+            for done, total, offsets in self.findAll(pattern.literal, position):
+                yield done, total, (offsets, None) if offsets is not None else None
+            return
+        self.bytesScanned = 0
+        start = time.perf_counter()
+        end = self.chunks.size
+        nextPos = position
+        for windowPos, filled, limit in self.patternWindows(position, end, pattern.maxLength):
+            offsets = Array('q')
+            lengths = Array('q')
+            for match in pattern.regex.finditer(self.buffer, max(nextPos - windowPos, 0), filled):
+                if match.start() >= limit:
+                    break
+                if match.end() > match.start():
+                    offsets.append(windowPos + match.start())
+                    lengths.append(match.end() - match.start())
+                    nextPos = windowPos + match.end()
+            self.seconds = time.perf_counter() - start
+            yield windowPos + limit, end, (offsets, lengths) if len(offsets) > 0 else None
+
+    def findSignatures(self, signatures: Signatures, position: int = 0):
+        """
+        Generates (done, total, matches) like findAll(), matches is a tuple
+        (offsets, lengths, ids) of array('q') or None, ids are indices into
+        the signatures. All occurrences are reported, also overlapping ones.
+        """
+        self.bytesScanned = 0
+        if signatures.delta is not None:
+            yield from self.runAutomaton(signatures, position)
+        elif signatures.regex is not None:
+            yield from self.runSignatureRegex(signatures, position)
+
+    def runSignatureRegex(self, signatures: Signatures, position: int):
+        start = time.perf_counter()
+        end = self.chunks.size
+        regex = signatures.regex
+        for windowPos, filled, limit in self.patternWindows(position, end, signatures.maxLength - 1):
+            offsets = Array('q')
+            lengths = Array('q')
+            ids = Array('q')
+            match = regex.search(self.buffer, 0, filled)
+            while match is not None and match.start() < limit:
+                for idx in signatures.prefixIds[bytes(match.group())]:
+                    offsets.append(windowPos + match.start())
+                    lengths.append(len(signatures.patterns[idx]))
+                    ids.append(idx)
+                match = regex.search(self.buffer, match.start() + 1, filled)
+            self.seconds = time.perf_counter() - start
+            yield windowPos + limit, end, (offsets, lengths, ids) if len(offsets) > 0 else None
+
+    def runAutomaton(self, signatures: Signatures, position: int):
+        # The state is carried from window to window, so the windows need no overlap
+        start = time.perf_counter()
+        end = self.chunks.size
+        delta = signatures.delta
+        firstOutput = signatures.firstOutput
+        state = 0
+        for windowPos, filled in self.windows(position, end, 0):
+            hits = []
+            pos = windowPos
+            for byte in self.buffer[:filled]:
+                state = delta[state][byte]
+                if state >= firstOutput:
+                    hits.append((pos, state))
+                pos += 1
+            matches = sorted((last + 1 - len(signatures.patterns[idx]), idx)
+                             for last, hitState in hits for idx in signatures.outputs[hitState - firstOutput])
+            self.seconds = time.perf_counter() - start
+            if len(matches) > 0:
+                yield windowPos + filled, end, (Array('q', (offset for offset, _ in matches)),
+                                                Array('q', (len(signatures.patterns[idx]) for _, idx in matches)),
+                                                Array('q', (idx for _, idx in matches)))
+            else:
+                yield windowPos + filled, end, None
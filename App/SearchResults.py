@@ -0,0 +1,156 @@
+from array import array as Array
+
+from PyQt5.QtWidgets import QWidget, QListView, QLabel, QProgressBar, QPushButton, QVBoxLayout, QHBoxLayout
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, Qt
+from PyQt5.QtCore import pyqtSignal as QSignal
+from App.Chunks import Chunks
+from App.BytePattern import BytePattern
+from App.Signatures import Signatures
+from App.SearchEngine import SearchEngine
+from App.Worker import Worker
+
+
+class SearchResultsModel(QAbstractListModel):
+    """
+    List of match positions, stored in an array('q') with 8 bytes per match.
+    Rows are formatted only when they are shown, so millions of matches
+    need no more than their array. Matches of a regular expression differ in
+    length, their lengths are stored in a second array. Matches of a
+    signature scan also store the index of their label.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.offsets = Array('q')
+        self.lengths = Array('q')
+        self.ids = Array('q')
+        self.length = 0
+        self.labels = None
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.offsets)
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
+        if role == Qt.DisplayRole and 0 <= index.row() < len(self.offsets):
+            if self.labels is not None:
+                return f"{self.offsets[index.row()]}: {self.labels[self.ids[index.row()]]}"
+            return str(self.offsets[index.row()])
+        return None
+
+    def clear(self, length: int = 0, labels: list = None) -> None:
+        # length is the length of all matches, or None if they differ
+        self.beginResetModel()
+        self.offsets = Array('q')
+        self.lengths = Array('q')
+        self.ids = Array('q')
+        self.length = length
+        self.labels = labels
+        self.endResetModel()
+
+    def append(self, offsets: Array, lengths: Array = None, ids: Array = None) -> None:
+        row = len(self.offsets)
+        self.beginInsertRows(QModelIndex(), row, row + len(offsets) - 1)
+        self.offsets.extend(offsets)
+        if lengths is not None:
+            self.lengths.extend(lengths)
+        if ids is not None:
+            self.ids.extend(ids)
+        self.endInsertRows()
+
+    def matchLength(self, row: int) -> int:
+        return self.length if self.length is not None else self.lengths[row]
+
+
+# noinspection PyUnresolvedReferences
+class SearchResults(QWidget):
+    """
+    Shows the matches of a Find All or a signature scan, which run on a
+    worker thread over a snapshot of the data. The matches are added while the search goes on,
+    activating a match emits jumpTo with its position and length.
+    """
+
+    jumpTo = QSignal('qint64', int)
+
+    def __init__(self, parent: QWidget = None):
+        super().__init__(parent)
+        self.worker = None
+        self.engine = None
+        self.model = SearchResultsModel(self)
+
+        self.labelResult = QLabel(self)
+        self.progressBar = QProgressBar(self)
+        self.progressBar.setRange(0, 1000)
+        self.buttonCancel = QPushButton('Cancel', self)
+        self.buttonCancel.clicked.connect(self.cancel)
+        self.listView = QListView(self)
+        self.listView.setUniformItemSizes(True)
+        self.listView.setModel(self.model)
+        self.listView.activated.connect(self.matchActivated)
+
+        topLayout = QHBoxLayout()
+        topLayout.addWidget(self.labelResult)
+        topLayout.addWidget(self.progressBar)
+        topLayout.addWidget(self.buttonCancel)
+        mainLayout = QVBoxLayout(self)
+        mainLayout.addLayout(topLayout)
+        mainLayout.addWidget(self.listView)
+        self.showRunning(False)
+
+    def findAll(self, chunks: Chunks, pattern: BytePattern) -> None:
+        self.cancel()
+        self.model.clear(pattern.length)
+        self.engine = SearchEngine(chunks.snapshot())
+        self.start(Worker(self.engine.findMatches, pattern))
+
+    def scanSignatures(self, chunks: Chunks, signatures: Signatures) -> None:
+        self.cancel()
+        self.model.clear(None, signatures.names)
+        self.engine = SearchEngine(chunks.snapshot())
+        self.start(Worker(self.engine.findSignatures, signatures))
+
+    def start(self, worker: Worker) -> None:
+        self.worker = worker
+        self.worker.signals.progress.connect(self.showProgress)
+        self.worker.signals.result.connect(self.matchesFound)
+        self.worker.signals.finished.connect(self.searchFinished)
+        self.labelResult.setText('Searching...')
+        self.showRunning(True)
+        self.worker.start()
+
+    def cancel(self) -> None:
+        if self.worker is not None:
+            self.worker.cancel()
+
+    def isRunning(self) -> bool:
+        return self.worker is not None
+
+    def showRunning(self, running: bool) -> None:
+        self.progressBar.setValue(0)
+        self.progressBar.setVisible(running)
+        self.buttonCancel.setVisible(running)
+
+    def isCurrent(self) -> bool:
+        # Signals of a canceled search may still arrive after a new one started
+        return self.worker is not None and self.sender() is self.worker.signals
+
+    def matchesFound(self, matches: tuple) -> None:
+        if self.isCurrent():
+            self.model.append(*matches)
+
+    def showProgress(self, done: int, total: int) -> None:
+        if not self.isCurrent():
+            return
+        self.progressBar.setValue(done * 1000 // total if total > 0 else 0)
+        self.labelResult.setText(f"{len(self.model.offsets)} matches")
+
+    def searchFinished(self, success: bool) -> None:
+        if not self.isCurrent():
+            return
+        self.worker = None
+        self.showRunning(False)
+        state = '' if success else ' (canceled)'
+        self.labelResult.setText(f"{len(self.model.offsets)} matches{state}, "
+                                 f"{self.engine.throughput() / 0x100000:.0f} MiB/s")
+
+    def matchActivated(self, index: QModelIndex) -> None:
+        self.jumpTo.emit(self.model.offsets[index.row()], self.model.matchLength(index.row()))
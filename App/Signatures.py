@@ -0,0 +1,126 @@
+import re
+from collections import deque
+
+REGEX_FIRST_BYTES = 32
+MAX_AUTOMATON_STATES = 0x4000
+
+
+class Signatures:
+    """
+    A library of named byte sequences, which are found in one pass.
+
+    The sequences are put into a trie, which is compiled once to a search
+    automaton. Which one depends on the number of different first bytes:
+
+    - Few of them: the trie becomes a single bytes regex. re skips the bytes
+      which start no signature in C and walks the trie from the others, it
+      returns the longest signature there. All shorter signatures at the same
+      position are its prefixes and are looked up in prefixIds. Searching again
+      one byte behind each match also finds overlapping occurrences.
+    - Many of them: the trie becomes an Aho-Corasick automaton with a full
+      transition table (delta), which is fed every byte once. The states with
+      outputs are numbered from firstOutput on.
+
+    A signature file has one "name = hex bytes" line per signature, empty
+    lines and lines starting with '#' are skipped.
+    """
+
+    def __init__(self, signatures: list):
+        # signatures is a list of (name, bytes)
+        self.names = [name for name, _ in signatures]
+        self.patterns = [bytes(pattern) for _, pattern in signatures]
+        self.maxLength = max((len(pattern) for pattern in self.patterns), default=0)
+        trie = {}
+        states = 1
+        for idx, pattern in enumerate(self.patterns):
+            if len(pattern) == 0:
+                continue
+            node = trie
+            for byte in pattern:
+                if byte not in node:
+                    node[byte] = {}
+                    states += 1
+                node = node[byte]
+            node.setdefault(None, []).append(idx)
+        self.regex = None
+        self.delta = None
+        self.firstOutput = 0
+        self.outputs = []
+        self.prefixIds = {}
+        if len(trie) > REGEX_FIRST_BYTES and states <= MAX_AUTOMATON_STATES:
+            self.buildAutomaton(trie)
+        elif len(trie) > 0:
+            self.collectPrefixIds(trie, b'', [])
+            self.regex = re.compile(self.trieRegex(trie), re.DOTALL)
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def collectPrefixIds(self, node: dict, path: bytes, ids: list) -> None:
+        # Maps every signature to the ids of the signatures it starts with, itself included
+        if None in node:
+            ids = ids + node[None]
+            self.prefixIds[path] = ids
+        for byte, child in node.items():
+            if byte is not None:
+                self.collectPrefixIds(child, path + bytes([byte]), ids)
+
+    def trieRegex(self, node: dict) -> bytes:
+        # Longer signatures are tried first, the optional group is greedy
+        alternatives = [re.escape(bytes([byte])) + self.trieRegex(child)
+                        for byte, child in sorted((k, v) for k, v in node.items() if k is not None)]
+        if len(alternatives) == 0:
+            return b''
+        if len(alternatives) == 1 and None not in node:
+            return alternatives[0]
+        group = b'(?:' + b'|'.join(alternatives) + b')'
+        return group + b'?' if None in node else group
+
+    def buildAutomaton(self, trie: dict) -> None:
+        # Number the trie nodes breadth first, the failure links point to shallower states
+        nodes = [trie]
+        delta = [[0] * 256]
+        fail = [0]
+        outputs = [[]]
+        queue = deque([0])
+        while queue:
+            state = queue.popleft()
+            row = list(delta[fail[state]]) if state != 0 else [0] * 256
+            for byte, child in nodes[state].items():
+                if byte is None:
+                    continue
+                nextState = len(nodes)
+                nodes.append(child)
+                fail.append(delta[fail[state]][byte] if state != 0 else 0)
+                outputs.append(child.get(None, []) + outputs[fail[nextState]])
+                delta.append(None)
+                row[byte] = nextState
+                queue.append(nextState)
+            delta[state] = row
+        # Renumber, so a single compare tells if a state has outputs
+        order = [s for s in range(len(nodes)) if not outputs[s]] + [s for s in range(len(nodes)) if outputs[s]]
+        newState = [0] * len(nodes)
+        for new, old in enumerate(order):
+            newState[old] = new
+        self.delta = [[newState[s] for s in delta[old]] for old in order]
+        self.firstOutput = len(nodes) - sum(1 for s in outputs if s)
+        self.outputs = [outputs[old] for old in order[self.firstOutput:]]
+
+    @staticmethod
+    def load(fileName: str) -> 'Signatures':
+        # Raises OSError or ValueError with the line number of a bad line
+        signatures = []
+        with open(fileName, encoding='utf-8') as file:
+            for lineNumber, line in enumerate(file, 1):
+                line = line.strip()
+                if len(line) == 0 or line.startswith('#'):
+                    continue
+                name, sep, hexBytes = line.rpartition('=')
+                try:
+                    pattern = bytes.fromhex(hexBytes)
+                except ValueError:
+                    pattern = bytes()
+                if len(sep) == 0 or len(name.strip()) == 0 or len(pattern) == 0:
+                    raise ValueError(f"{fileName}, line {lineNumber}: expected 'name = hex bytes'")
+                signatures.append((name.strip(), pattern))
+        return Signatures(signatures)
@@ -0,0 +1,98 @@
+import functools
+import json
+import threading
+import time
+from collections import deque
+
+RECENT_CALLS = 120
+
+
+class Counter:
+    __slots__ = ('calls', 'amount', 'seconds', 'maxSeconds', 'recent')
+
+    def __init__(self):
+        self.calls = 0
+        self.amount = 0
+        self.seconds = 0.0
+        self.maxSeconds = 0.0
+        self.recent = deque(maxlen=RECENT_CALLS)
+
+    def toDict(self) -> dict:
+        recent = list(self.recent)
+        return {
+            'calls': self.calls,
+            'amount': self.amount,
+            'seconds': self.seconds,
+            'maxSeconds': self.maxSeconds,
+            'recentSeconds': sum(recent) / len(recent) if len(recent) > 0 else 0.0,
+        }
+
+
+class Stats:
+    """
+    Opt-in counters and timings of the hot paths, by name.
+
+    Nothing is recorded until enabled is set, the instrumented code only
+    checks the flag then. Every counter holds the number of calls, an amount
+    (bytes or pieces, depending on the counter), the total and the longest
+    time and the times of the last RECENT_CALLS calls. Counters are updated
+    from worker threads as well, they are protected by a lock.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.started = time.time()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.counters = {}
+            self.started = time.time()
+
+    def record(self, name: str, amount: int = 0, seconds: float = 0.0) -> None:
+        with self.lock:
+            counter = self.counters.get(name)
+            if counter is None:
+                counter = self.counters[name] = Counter()
+            counter.calls += 1
+            counter.amount += amount
+            counter.seconds += seconds
+            counter.maxSeconds = max(counter.maxSeconds, seconds)
+            counter.recent.append(seconds)
+
+    def timed(self, name: str, amount=None):
+        # Decorator recording the calls of a function, amount(result) gives the amount of a call
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter()
+                result = function(*args, **kwargs)
+                self.record(name, amount(result) if amount is not None else 0, time.perf_counter() - start)
+                return result
+            return wrapper
+        return decorator
+
+    def get(self, name: str) -> dict:
+        with self.lock:
+            counter = self.counters.get(name)
+            return counter.toDict() if counter is not None else Counter().toDict()
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                'started': self.started,
+                'duration': time.time() - self.started,
+                'counters': {name: counter.toDict() for name, counter in sorted(self.counters.items())},
+            }
+
+    def export(self, fileName: str) -> None:
+        # Raises OSError if the file cannot be written
+        with open(fileName, 'w') as file:
+            json.dump(self.snapshot(), file, indent=2)
+
+
+# The instance shared by all instrumented code
+stats = Stats()
@@ -1,100 +1,241 @@
-from PyQt5.QtWidgets import QUndoStack, QUndoCommand
+from PyQt5.QtWidgets import QUndoCommand
 from PyQt5.QtCore import QObject
+from PyQt5.QtCore import pyqtSignal as QSignal
 from App.Chunks import Chunks
+from App.Stats import stats
+from collections import deque
 from enum import Enum
 
+UNDO_LIMIT = 0x400000
+PIECE_SIZE = 128
+
 class CCmd(Enum):
-    insert = 0 
+    insert = 0
     removeAt = 1
     overwrite = 2
 
-# Helper class to store single byte commands
-class CharCommand(QUndoCommand):
-    
-    def __init__(self, chunks: Chunks, cmd: CCmd, charPos: int, newChar: bytes, parent: QUndoCommand = None):
-        super().__init__()
+# Base class of the commands, undo and redo restore snapshots of the data
+class SnapshotCommand(QUndoCommand):
+    def __init__(self, chunks: Chunks, pos: int, parent: QUndoCommand = None):
+        super().__init__(parent)
         self.chunks = chunks
-        self.cmd = cmd
-        self.charPos = charPos
-        self.newChar = newChar
-        self.oldChar = bytes()
-
-    def mergeWith(self, command): # command: CharCommand()
-        nextCommand = command
-        result = False
-        if self.cmd != CCmd.removeAt:
-            if nextCommand.cmd == CCmd.overwrite:
-                if nextCommand.charPos == self.charPos:
-                    self.newChar = nextCommand.newChar
-                    result = True
-        return result
+        self.pos = pos
+        # Snapshots of the data before and after the command, they share all
+        # unchanged pieces, so no old bytes have to be copied for undo
+        self.before = None
+        self.after = None
+        # Bytes from pos on which differ between the snapshots, -1 for all behind pos
+        self.dirtyLength = -1
+        # Pieces copied by the command, see size
+        self.copied = 0
+
+    @property
+    def size(self) -> int:
+        # Estimated memory held by the command alone. The bytes it appended to
+        # the add buffer stay there when it is dropped, so they do not count.
+        return PIECE_SIZE * self.copied
+
+    def apply(self):
+        raise NotImplementedError
+
+    def copiedPieces(self, countBefore: int, countAfter: int) -> int:
+        # An edit copies the paths from the root to the pieces it touched
+        return abs(countAfter - countBefore) + 2 * countAfter.bit_length()
 
     def redo(self):
-        if self.cmd == CCmd.insert:
-            self.chunks.insert(self.charPos, self.newChar)
-        if self.cmd == CCmd.overwrite:
-            self.oldChar = self.chunks.at(self.charPos)
-            self.wasChanged = self.chunks.dataChanged(self.charPos)
-            self.chunks.overwrite(self.charPos, self.newChar)
-        if self.cmd == CCmd.removeAt:
-            self.oldChar = self.chunks.at(self.charPos)
-            self.wasChanged = self.chunks.dataChanged(self.charPos)
-            self.chunks.removeAt(self.charPos)
+        if self.after is not None:
+            self.chunks.restoreState(self.after, self.pos, self.dirtyLength)
+            return
+        pieces = self.chunks.pieces
+        self.before = self.chunks.state()
+        countBefore = pieces.count
+        self.apply()
+        self.after = self.chunks.state()
+        self.copied = self.copiedPieces(countBefore, pieces.count)
 
     def undo(self):
+        self.chunks.restoreState(self.before, self.pos, self.dirtyLength)
+
+
+# Helper class to store commands on a range of bytes
+class RangeCommand(SnapshotCommand):
+    names = {CCmd.insert: 'Insert', CCmd.removeAt: 'Delete', CCmd.overwrite: 'Overwrite'}
+
+    def __init__(self, chunks: Chunks, cmd: CCmd, pos: int, data: bytes = bytes(), length: int = -1,
+                 parent: QUndoCommand = None):
+        super().__init__(chunks, pos, parent)
+        self.cmd = cmd
+        self.data = data
+        self.length = len(data) if length < 0 else length
+        if cmd == CCmd.overwrite:
+            self.dirtyLength = self.length
+        # Keys edit single bytes, only those commands are merged
+        self.typing = self.length == 1
+        self.setText(f"{self.names[cmd]} {self.length} chars")
+
+    def mergeWith(self, command): # command: RangeCommand()
+        # Typing is one undo step: inserts and overwrites which continue the
+        # range, overwrites inside of inserted bytes, Delete at the same and
+        # Backspace at the previous position. Pastes and other edits of
+        # several bytes stay single steps.
+        if not (self.typing and command.typing):
+            return False
+        ofs = command.pos - self.pos
+        if self.cmd == CCmd.insert and command.cmd == CCmd.insert and 0 <= ofs <= self.length:
+            self.length += command.length
+        elif self.cmd == CCmd.insert and command.cmd == CCmd.overwrite and 0 <= ofs and \
+                ofs + command.length <= self.length:
+            pass
+        elif self.cmd == CCmd.overwrite and command.cmd == CCmd.overwrite and 0 <= ofs <= self.length:
+            self.length = max(self.length, ofs + command.length)
+            self.dirtyLength = self.length
+        elif self.cmd == CCmd.removeAt and command.cmd == CCmd.removeAt and ofs in (0, -command.length):
+            self.pos = command.pos
+            self.length += command.length
+        else:
+            return False
+        # the snapshot between both commands is dropped
+        self.after = command.after
+        self.copied = max(self.copied, command.copied)
+        self.setText(f"{self.names[self.cmd]} {self.length} chars")
+        return True
+
+    def apply(self):
         if self.cmd == CCmd.insert:
-            self.chunks.removeAt(self.charPos)
+            self.chunks.insertRange(self.pos, self.data)
         if self.cmd == CCmd.overwrite:
-            self.chunks.overwrite(self.charPos, self.oldChar)
-            self.chunks.setDataChanged(self.charPos, self.wasChanged)
+            self.chunks.overwriteRange(self.pos, self.data)
         if self.cmd == CCmd.removeAt:
-            self.chunks.insert(self.charPos, self.oldChar)
-            self.chunks.setDataChanged(self.charPos, self.wasChanged)
+            self.chunks.removeRange(self.pos, self.length)
+        # The after snapshot holds the bytes from now on
+        self.data = None
 
     def id(self): return 1477 # It must be an integer unique to this command's class
 
 
-class UndoStack(QUndoStack):
-    def __init__(self, chunks: Chunks, parent: QObject):
-        super().__init__()
+# Replaces all matches in one pass, so a Replace All is a single undo step
+class ReplaceAllCommand(SnapshotCommand):
+    def __init__(self, chunks: Chunks, positions, lengths, data: bytes, parent: QUndoCommand = None):
+        super().__init__(chunks, positions[0], parent)
+        self.positions = positions
+        self.lengths = lengths
+        self.data = data
+        if all(length == len(data) for length in lengths):
+            self.dirtyLength = positions[-1] + lengths[-1] - positions[0]
+        self.setText(f"Replace {len(positions)} occurrences")
+
+    def apply(self):
+        self.chunks.replaceAll(self.positions, self.lengths, self.data)
+        self.positions = self.lengths = self.data = None
+
+    def copiedPieces(self, countBefore: int, countAfter: int) -> int:
+        # The tree is built anew
+        return countAfter
+
+
+class UndoStack(QObject):
+    """
+    The history of the commands on the data, with the interface of
+    QUndoStack that is used here.
+
+    The history is limited by the memory its commands hold (see
+    SnapshotCommand.size) instead of their number, the oldest commands are
+    dropped. Commands with the same id() are merged as in QUndoStack.
+    index() counts all commands since clear(), the dropped ones included,
+    so it is 0 only for the unchanged data. The index of the saved data is
+    marked by setClean(), as in QUndoStack.
+    """
+
+    indexChanged = QSignal(int)
+    cleanChanged = QSignal(bool)
+
+    def __init__(self, chunks: Chunks, parent: QObject = None, limit: int = UNDO_LIMIT):
+        super().__init__(parent)
         self.chunks = chunks
-        self.parent = parent
-        self.setUndoLimit(1000)
+        self.limit = limit
+        self.commands = deque()
+        self.first = 0 # index of the oldest command kept
+        self.current = 0
+        self.size = 0
+        self.cleanIndex = 0 # -1 if the saved state cannot be reached anymore
+
+    @stats.timed('UndoStack.push')
+    def push(self, command: SnapshotCommand):
+        while self.first + len(self.commands) > self.current:
+            self.size -= self.commands.pop().size
+        if self.cleanIndex > self.current:
+            self.cleanIndex = -1
+        command.redo()
+        top = self.commands[-1] if len(self.commands) > 0 else None
+        topSize = top.size if top is not None else 0
+        if top is not None and command.id() != -1 and top.id() == command.id() and top.mergeWith(command):
+            self.size += top.size - topSize
+            if self.cleanIndex == self.current:
+                # the saved command changed, the saved state is gone
+                self.cleanIndex = -1
+        else:
+            self.commands.append(command)
+            self.size += command.size
+            self.current += 1
+        while self.size > self.limit and len(self.commands) > 1:
+            self.size -= self.commands.popleft().size
+            self.first += 1
+        self.indexChanged.emit(self.current)
+
+    def undo(self):
+        if self.canUndo():
+            self.current -= 1
+            self.commands[self.current - self.first].undo()
+            self.indexChanged.emit(self.current)
+
+    def redo(self):
+        if self.canRedo():
+            self.commands[self.current - self.first].redo()
+            self.current += 1
+            self.indexChanged.emit(self.current)
+
+    def canUndo(self) -> bool:
+        return self.current > self.first
+
+    def canRedo(self) -> bool:
+        return self.current < self.first + len(self.commands)
+
+    def index(self) -> int:
+        return self.current
+
+    def count(self) -> int:
+        return len(self.commands)
+
+    def isClean(self) -> bool:
+        return self.current == self.cleanIndex
+
+    def setClean(self):
+        self.cleanIndex = self.current
+        self.cleanChanged.emit(True)
+
+    def resetClean(self):
+        # No state is the saved one anymore
+        self.cleanIndex = -1
+        self.cleanChanged.emit(False)
+
+    def clear(self):
+        self.commands.clear()
+        self.first = self.current = self.size = self.cleanIndex = 0
+        self.indexChanged.emit(0)
 
     def removeAt(self, pos: int, length: int):
-        if 0 <= pos < self.chunks.size:
-            if length == 1:
-                cc = CharCommand(self.chunks, CCmd.removeAt, pos, bytes(1)) # zero filled byte
-                self.push(cc)
-            else:
-                txt = f"Delete {length} chars"
-                self.beginMacro(txt)
-                for i in range(length):
-                    cc = CharCommand(self.chunks, CCmd.removeAt, pos, bytes(1)) # zero filled byte
-                    self.push(cc)
-                self.endMacro()
+        if 0 <= pos < self.chunks.size and length > 0:
+            length = min(length, self.chunks.size - pos)
+            self.push(RangeCommand(self.chunks, CCmd.removeAt, pos, length=length))
 
     def insert(self, pos: int, ba: bytes):
-        if 0 <= pos <= self.chunks.size:
-            if len(ba) == 1:
-                cc = CharCommand(self.chunks, CCmd.insert, pos, ba)
-                self.push(cc)
-            elif len(ba) > 1:
-                txt = f"Insert {len(ba)} chars"
-                self.beginMacro(txt)
-                for i in range(len(ba)):
-                    cc = CharCommand(self.chunks, CCmd.insert, pos + i, ba[i:i+1])
-                    self.push(cc)
-                self.endMacro()                
+        if 0 <= pos <= self.chunks.size and len(ba) > 0:
+            self.push(RangeCommand(self.chunks, CCmd.insert, pos, bytes(ba)))
 
     def overwrite(self, pos: int, ba: bytes): # no length argument - len(ba) instead
-        if 0 <= pos < self.chunks.size:
-            if len(ba) == 1:
-                cc = CharCommand(self.chunks, CCmd.overwrite, pos, ba)
-                self.push(cc)
-            elif len(ba) > 1:
-                txt = f"Overwrite {len(ba)} chars"
-                self.beginMacro(txt)
-                self.removeAt(pos, len(ba))
-                self.insert(pos, ba)
-                self.endMacro()
+        if 0 <= pos < self.chunks.size and len(ba) > 0:
+            self.push(RangeCommand(self.chunks, CCmd.overwrite, pos, bytes(ba)))
+
+    def replaceAll(self, positions, lengths, ba: bytes): # positions sorted, not overlapping
+        if len(positions) > 0 and len(positions) == len(lengths):
+            self.push(ReplaceAllCommand(self.chunks, positions, lengths, bytes(ba)))
@@ -0,0 +1,79 @@
+import sys
+import traceback
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QThread
+from PyQt5.QtCore import pyqtSignal as QSignal
+
+POOL_THREADS = 4
+# Jobs the view waits for are started before the queued background jobs
+INTERACTIVE = 1
+BACKGROUND = 0
+
+
+def threadPool() -> QThreadPool:
+    """
+    The thread pool of all workers of all documents. It is bounded by
+    POOL_THREADS, or the number of cores if there are less, so opening many
+    files never starts more threads, further jobs wait in its queue. It is
+    the global pool, the application waits for its jobs when it quits.
+    """
+    pool = QThreadPool.globalInstance()
+    threads = max(min(POOL_THREADS, QThread.idealThreadCount()), 2)
+    if pool.maxThreadCount() != threads:
+        pool.setMaxThreadCount(threads)
+    return pool
+
+
+class Canceled(Exception):
+    # Raised by the data a job reads when it is no longer valid, the job ends as canceled
+    pass
+
+
+class WorkerSignals(QObject):
+    progress = QSignal('qint64', 'qint64')
+    result = QSignal(object)
+    finished = QSignal(bool)
+
+
+class Worker(QRunnable):
+    """
+    Runs a job on the thread pool.
+
+    The job is a generator function, every item it yields is a tuple
+    (done, total, result): progress is emitted with done and total, result
+    is emitted when it is not None. cancel() stops the job at its next item.
+    finished is emitted at the end, with False if the job was canceled or
+    failed. The signals are delivered in the thread of the creator.
+    The worker runs on the shared threadPool(), the pool deletes it after
+    the job. Workers of a higher priority are started first.
+    """
+
+    def __init__(self, job, *args, priority: int = BACKGROUND):
+        super().__init__()
+        self.signals = WorkerSignals()
+        self.job = job
+        self.args = args
+        self.priority = priority
+        self.canceled = False
+
+    def run(self) -> None:
+        success = True
+        try:
+            for done, total, result in self.job(*self.args):
+                self.signals.progress.emit(done, total)
+                if result is not None:
+                    self.signals.result.emit(result)
+                if self.canceled:
+                    break
+        except Canceled:
+            self.canceled = True
+        except Exception:
+            traceback.print_exc(file=sys.stderr)
+            success = False
+        self.signals.finished.emit(success and not self.canceled)
+
+    def start(self) -> None:
+        threadPool().start(self, self.priority)
+
+    def cancel(self) -> None:
+        self.canceled = True
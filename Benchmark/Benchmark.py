@@ -0,0 +1,271 @@
+import hashlib
+import os
+import platform
+import random
+import statistics
+import time
+
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QFile
+from App.Chunks import Chunks
+from App.HashTree import HashTree, MAX_LEAF, leafLength
+from App.UndoStack import UndoStack
+from App.QHexEdit import QHexEdit
+from Window.QHexWindow import QHexWindow
+
+MARKER = b'PYHEXEDITOR-BENCHMARK'
+BLOCK_SIZE = 0x100000
+# Maps random bytes to text, which has no 00 00 markers for the hash tree
+TEXT_TABLE = bytes(b'abcdefghijklmnopqrstuvwxyz \n'[value % 28] for value in range(256))
+
+
+class Benchmark:
+    """
+    Times the hot paths of the editor on synthetic files of the given sizes.
+
+    Every benchmark is run repeat times, the median of the seconds per
+    operation is reported under the name "<benchmark>/<size>". The files are
+    random data with MARKER near the end and near the start, so indexOf()
+    and lastIndexOf() scan almost the whole file.
+
+    The hash tree is timed on random text of the same size, which has no
+    markers and is cut by the rolling sum only. Its benchmark also checks the incremental root against the
+    root of the edited bytes, a wrong root raises a ValueError.
+    """
+
+    def __init__(self, sizes: list, directory: str, repeat: int = 5, seed: int = 1):
+        self.sizes = sizes
+        self.directory = directory
+        self.repeat = repeat
+        self.seed = seed
+        self.results = {}
+
+    @staticmethod
+    def parseSize(text: str) -> int:
+        # "1M", "256K" or "2G" in powers of 1024, plain numbers are bytes
+        units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+        text = text.strip().upper()
+        if text[-1:] in units:
+            return int(float(text[:-1]) * units[text[-1]])
+        return int(text)
+
+    @staticmethod
+    def sizeName(size: int) -> str:
+        for unit, factor in (('G', 1 << 30), ('M', 1 << 20), ('K', 1 << 10)):
+            if size >= factor and size % factor == 0:
+                return f"{size // factor}{unit}"
+        return str(size)
+
+    def makeFile(self, size: int, text: bool = False) -> str:
+        # Existing files of the right size are reused, generating several GB takes a while
+        fileName = os.path.join(self.directory, f"benchmark-{self.sizeName(size)}.{'txt' if text else 'bin'}")
+        if os.path.exists(fileName) and os.path.getsize(fileName) == size:
+            return fileName
+        block = random.Random(self.seed).getrandbits(8 * BLOCK_SIZE).to_bytes(BLOCK_SIZE, 'little')
+        if text:
+            block = block.translate(TEXT_TABLE)
+        with open(fileName, 'wb') as file:
+            for position in range(0, size, BLOCK_SIZE):
+                file.write(block[:size - position])
+            for position in (min(1000, size // 4), max(size - 1000, size // 2)):
+                file.seek(position)
+                file.write(MARKER)
+        return fileName
+
+    def measure(self, name: str, job, count: int = 1, setup=None) -> float:
+        # job is timed repeat times, setup prepares its argument outside of the timing
+        times = []
+        for _ in range(self.repeat):
+            argument = setup() if setup is not None else None
+            start = time.perf_counter()
+            job(argument)
+            times.append((time.perf_counter() - start) / count)
+        self.results[name] = statistics.median(times)
+        return self.results[name]
+
+    def run(self) -> dict:
+        for size in self.sizes:
+            fileName = self.makeFile(size)
+            suffix = self.sizeName(size)
+            self.benchData(fileName, suffix)
+            self.benchEdits(fileName, suffix)
+            self.benchSearch(fileName, suffix)
+            self.benchUndo(fileName, suffix)
+            self.benchSave(fileName, suffix)
+            self.benchPaint(fileName, suffix)
+            self.benchHashTree(self.makeFile(size, text=True), suffix)
+        return self.report()
+
+    def report(self) -> dict:
+        return {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': self.repeat,
+            'results': self.results,
+        }
+
+    @staticmethod
+    def openChunks(fileName: str) -> Chunks:
+        return Chunks(None, QFile(fileName))
+
+    def benchData(self, fileName: str, suffix: str) -> None:
+        chunks = self.openChunks(fileName)
+        rand = random.Random(self.seed)
+        positions = [rand.randrange(chunks.size) for _ in range(1000)]
+        self.measure(f"chunks.data.4k/{suffix}",
+                     lambda _: [chunks.data(position, 0x1000) for position in positions], len(positions))
+        # the same reads on an edited piece table
+        for position in positions[::10]:
+            chunks.overwriteRange(position, b'\xff')
+        self.measure(f"chunks.data.4k.edited/{suffix}",
+                     lambda _: [chunks.data(position, 0x1000) for position in positions], len(positions))
+
+    def benchEdits(self, fileName: str, suffix: str) -> None:
+        rand = random.Random(self.seed)
+        count = 1000
+
+        def edit(operation):
+            def job(chunks):
+                for _ in range(count):
+                    operation(chunks, rand.randrange(chunks.size))
+            return job
+
+        setup = lambda: self.openChunks(fileName)
+        self.measure(f"chunks.insert/{suffix}", edit(lambda c, p: c.insertRange(p, b'\x00\x01')), count, setup)
+        self.measure(f"chunks.overwrite/{suffix}", edit(lambda c, p: c.overwriteRange(p, b'\x00\x01')), count, setup)
+        self.measure(f"chunks.removeAt/{suffix}", edit(lambda c, p: c.removeRange(p, 2)), count, setup)
+
+    def benchSearch(self, fileName: str, suffix: str) -> None:
+        chunks = self.openChunks(fileName)
+        self.measure(f"chunks.indexOf/{suffix}", lambda _: chunks.indexOf(MARKER, 2000))
+        self.measure(f"chunks.lastIndexOf/{suffix}", lambda _: chunks.lastIndexOf(MARKER, chunks.size - 2000))
+
+    def benchUndo(self, fileName: str, suffix: str) -> None:
+        rand = random.Random(self.seed)
+
+        def setup():
+            chunks = self.openChunks(fileName)
+            return chunks, UndoStack(chunks)
+
+        def typing(argument):
+            # 1000 typed bytes, which are merged, and 1000 overwrites at random positions
+            chunks, undoStack = argument
+            position = chunks.size // 2
+            for offset in range(1000):
+                undoStack.insert(position + offset, b'a')
+            for _ in range(1000):
+                undoStack.overwrite(rand.randrange(chunks.size), b'b')
+
+        def undoRedo(argument):
+            _, undoStack = argument
+            while undoStack.canUndo():
+                undoStack.undo()
+            while undoStack.canRedo():
+                undoStack.redo()
+
+        def typed():
+            argument = setup()
+            typing(argument)
+            return argument
+
+        def replaceAll(argument):
+            chunks, undoStack = argument
+            positions = list(range(0, chunks.size - 4, max(chunks.size // 10000, 4)))
+            undoStack.replaceAll(positions, [4] * len(positions), b'abcd')
+            undoStack.undo()
+
+        self.measure(f"undo.typing/{suffix}", typing, 2000, setup)
+        self.measure(f"undo.undoRedo/{suffix}", undoRedo, 2002, typed)
+        self.measure(f"undo.replaceAll/{suffix}", replaceAll, 1, setup)
+
+    def benchSave(self, fileName: str, suffix: str) -> None:
+        window = QHexWindow('Benchmark')
+        window.loadFile(fileName)
+        for position in range(0, window.hexEdit.chunks.size, max(window.hexEdit.chunks.size // 100, 1)):
+            window.hexEdit.replace(position, b'\x00')
+        target = os.path.join(self.directory, 'benchmark-save.bin')
+
+        def save(_):
+            # the file is written by a worker, committed when it is finished
+            window.saveFile(target)
+            window.waitForSave()
+
+        self.measure(f"window.saveFile/{suffix}", save)
+        window.hexEdit.undoStack.clear()
+        window.deleteLater()
+        os.remove(target)
+
+    def benchPaint(self, fileName: str, suffix: str) -> None:
+        hexEdit = QHexEdit()
+        hexEdit.resize(1000, 700)
+        hexEdit.show()
+        hexEdit.setDataDevice(QFile(fileName))
+        QApplication.processEvents()
+        scrollBar = hexEdit.verticalScrollBar()
+        rand = random.Random(self.seed)
+        rows = [rand.randrange(scrollBar.maximum() + 1) for _ in range(50)]
+
+        def scroll(_):
+            for row in rows:
+                scrollBar.setValue(row)
+                hexEdit.viewport().repaint()
+
+        def repaint(_):
+            for _ in range(50):
+                hexEdit.viewport().repaint()
+
+        self.measure(f"paint.scrollFrame/{suffix}", scroll, len(rows))
+        self.measure(f"paint.frame/{suffix}", repaint, 50)
+        hexEdit.deleteLater()
+
+    @staticmethod
+    def updateTree(tree: HashTree, chunks: Chunks) -> str:
+        for _, _, result in tree.update(chunks.snapshot()):
+            if result is not None:
+                return result[0]
+
+    @staticmethod
+    def treeRoot(chunks: Chunks) -> str:
+        # The root from the bytes alone, leaf by leaf, without anything reused
+        digests = []
+        position = 0
+        while position < chunks.size:
+            window = bytes(chunks.data(position, MAX_LEAF))
+            length = leafLength(window)
+            digests.append(hashlib.sha256(window[:length]).digest())
+            position += length
+        return hashlib.sha256(b''.join(digests)).hexdigest()
+
+    def benchHashTree(self, fileName: str, suffix: str) -> None:
+        rand = random.Random(self.seed)
+        chunks = self.openChunks(fileName)
+        tree = HashTree()
+        self.updateTree(tree, chunks)
+        self.measure(f"hashTree.initial/{suffix}", lambda _: self.updateTree(HashTree(), chunks))
+
+        def editNearLeafEnd():
+            # the edits which can move a cut: markers and inserts close to the end of a leaf
+            position = min(max(rand.choice(tree.ends) + rand.randint(-2000, 2000), 0), chunks.size - 2)
+            if rand.random() < 0.5:
+                chunks.overwriteRange(position, b'\x00\x00')
+            else:
+                chunks.insertRange(position, b'\x01')
+
+        roots = []
+        self.measure(f"hashTree.update/{suffix}", lambda _: roots.append(self.updateTree(tree, chunks)),
+                     setup=editNearLeafEnd)
+        if roots[-1] != self.treeRoot(chunks):
+            raise ValueError(f"hash tree root of {fileName} differs from the root of its bytes")
+
+    @staticmethod
+    def compare(report: dict, baseline: dict, tolerance: float) -> dict:
+        """
+        Returns {name: ratio} of the results which take more than
+        (1 + tolerance) times the time of the baseline.
+        """
+        regressions = {}
+        for name, seconds in report['results'].items():
+            reference = baseline.get('results', {}).get(name)
+            if reference and seconds > reference * (1 + tolerance):
+                regressions[name] = seconds / reference
+        return regressions
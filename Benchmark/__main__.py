@@ -0,0 +1,55 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+from PyQt5.QtWidgets import QApplication
+from Benchmark.Benchmark import Benchmark
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m Benchmark',
+                                     description='Times Chunks, UndoStack, search, saving and painting.')
+    parser.add_argument('--sizes', default='1M,16M,256M',
+                        help='comma separated sizes of the synthetic files, like 1M,16M,4G')
+    parser.add_argument('--repeat', type=int, default=5, help='runs of every benchmark, the median is reported')
+    parser.add_argument('--directory', default=None, help='where the synthetic files are kept, reused if present')
+    parser.add_argument('--output', default=None, help='JSON file for the results, stdout if not given')
+    parser.add_argument('--baseline', default=BASELINE, help='JSON results to compare with')
+    parser.add_argument('--update-baseline', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slowdown against the baseline, 0.25 is 25%%')
+    args = parser.parse_args()
+
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    app = QApplication(sys.argv[:1])
+    # Own settings, so the options of the editor are not touched
+    app.setApplicationName('PyHexEditorBenchmark')
+    app.setOrganizationName('PyHexEditor')
+
+    with tempfile.TemporaryDirectory() as temporary:
+        directory = args.directory or temporary
+        benchmark = Benchmark([Benchmark.parseSize(size) for size in args.sizes.split(',')], directory, args.repeat)
+        report = benchmark.run()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as file:
+            file.write(text + '\n')
+        sys.exit(0)
+    if not os.path.exists(args.baseline):
+        sys.exit(0)
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    regressions = Benchmark.compare(report, baseline, args.tolerance)
+    for name, ratio in sorted(regressions.items()):
+        print(f"{name}: {ratio:.2f}x slower than the baseline", file=sys.stderr)
+    sys.exit(1 if regressions else 0)
@@ -43,6 +43,8 @@ class OptionsDialog(QDialog):
             self.ui.cbHighlighting.setChecked(settings.value("Highlighting", 'true')=='true')
             self.ui.cbOverwriteMode.setChecked(settings.value("OverwriteMode", 'true')=='true')
             self.ui.cbReadOnly.setChecked(settings.value("ReadOnly", 'false')=='true')
+            self.ui.cbSaveInPlace.setChecked(settings.value("SaveInPlace", 'true')=='true')
+            self.ui.cbSaveJournal.setChecked(settings.value("SaveJournal", 'true')=='true')
 
         else:
             self.ui.sbAddressAreaWidth.setValue(settings.value("AddressAreaWidth", 4).toInt()[0])
@@ -51,6 +53,8 @@ class OptionsDialog(QDialog):
             self.ui.cbHighlighting.setChecked(settings.value("Highlighting", True).toBool())
             self.ui.cbOverwriteMode.setChecked(settings.value("OverwriteMode", True).toBool())
             self.ui.cbReadOnly.setChecked(settings.value("ReadOnly", False).toBool())
+            self.ui.cbSaveInPlace.setChecked(settings.value("SaveInPlace", True).toBool())
+            self.ui.cbSaveJournal.setChecked(settings.value("SaveJournal", True).toBool())
 
 
     def writeSettings(self):
@@ -64,12 +68,16 @@ class OptionsDialog(QDialog):
             settings.setValue("Highlighting", b(self.ui.cbHighlighting.isChecked()))
             settings.setValue("OverwriteMode", b(self.ui.cbOverwriteMode.isChecked()))
             settings.setValue("ReadOnly", b(self.ui.cbReadOnly.isChecked()))
+            settings.setValue("SaveInPlace", b(self.ui.cbSaveInPlace.isChecked()))
+            settings.setValue("SaveJournal", b(self.ui.cbSaveJournal.isChecked()))
         else:
             settings.setValue("AddressArea", self.ui.cbAddressArea.isChecked())
             settings.setValue("AsciiArea", self.ui.cbAsciiArea.isChecked())
             settings.setValue("Highlighting", self.ui.cbHighlighting.isChecked())
             settings.setValue("OverwriteMode", self.ui.cbOverwriteMode.isChecked())
             settings.setValue("ReadOnly", self.ui.cbReadOnly.isChecked())
+            settings.setValue("SaveInPlace", self.ui.cbSaveInPlace.isChecked())
+            settings.setValue("SaveJournal", self.ui.cbSaveJournal.isChecked())
         
         settings.setValue("HighlightingColor", self.ui.lbHighlightingColor.palette().color(QPalette.Background))
         settings.setValue("AddressAreaColor", self.ui.lbAddressAreaColor.palette().color(QPalette.Background))
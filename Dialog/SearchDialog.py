@@ -1,52 +1,128 @@
+import re
+from array import array as Array
+
 from PyQt5 import QtCore
-from PyQt5.QtWidgets import QDialog, QMessageBox
+from PyQt5.QtWidgets import QDialog, QMessageBox, QProgressDialog, QApplication
+from PyQt5.QtCore import Qt, pyqtSignal as QSignal
 
+from App.SearchEngine import SearchEngine
+from App.BytePattern import BytePattern
 from Dialog.ui_searchdialog import Ui_SearchDialog
 
 
 class SearchDialog(QDialog):
+    findAllRequested = QSignal(object) # BytePattern
+
     def __init__(self, parent, hexEdit):
         super(SearchDialog, self).__init__()
         self.ui = Ui_SearchDialog()
         self.ui.setupUi(self)
         self._hexEdit = hexEdit
         self.appName = parent.appName
-        
+
+    def setHexEdit(self, hexEdit):
+        self._hexEdit = hexEdit
+
     def findNext(self):
+        # Returns the position and length of the match, the position is -1 if there is none
         startIdx = self._hexEdit.cursorPosition // 2
-        findBa = self.getContent(self.ui.cbFindFormat.currentIndex(), self.ui.cbFind.currentText())
-        idx = -1
-        
-        if len(findBa) > 0:
-            if self.ui.cbBackwards.isChecked():
-                idx = self._hexEdit.lastIndexOf(findBa, startIdx)
-            else:
-                idx = self._hexEdit.indexOf(findBa, startIdx)
-        
-        return idx
+        pattern = self.getPattern()
+        if pattern is None:
+            return -1, 0
+        return self._hexEdit.findPattern(pattern, startIdx, self.ui.cbBackwards.isChecked())
         
     @QtCore.pyqtSlot()
     def on_pbFind_clicked(self):
         self.findNext()
         
+    @QtCore.pyqtSlot()
+    def on_pbFindAll_clicked(self):
+        pattern = self.getPattern()
+        if pattern is not None:
+            self.findAllRequested.emit(pattern)
+
     @QtCore.pyqtSlot()
     def on_pbReplace_clicked(self):
-        idx = self.findNext()
+        replaceBa = self.getReplacement()
+        if replaceBa is None:
+            return
+        idx, length = self.findNext()
         if idx >= 0:
-            replaceBa = self.getContent(self.ui.cbReplaceFormat.currentIndex(), self.ui.cbReplace.currentText())
-            self.replaceOccurrence(idx, replaceBa)
+            self.replaceOccurrence(idx, length, replaceBa)
             
     @QtCore.pyqtSlot()
     def on_pbReplaceAll_clicked(self):
+        if self.ui.cbPrompt.isChecked():
+            self.replaceAllPrompted()
+            return
+        pattern = self.getPattern()
+        replaceBa = self.getReplacement()
+        if pattern is None or replaceBa is None:
+            return
+        hexEdit, chunks = self._hexEdit, self._hexEdit.chunks
+        version = chunks.version
+        matches = self.findMatches(pattern)
+        if matches is None:
+            return
+        if self._hexEdit is not hexEdit or hexEdit.chunks is not chunks or chunks.version != version:
+            # the positions were found in other data
+            QMessageBox.warning(self, self.appName, "The data changed during the search, nothing was replaced")
+            return
+        positions, lengths = matches
+        # All matches are replaced in one pass, which is a single undo step
+        self._hexEdit.replaceAll(positions, lengths, replaceBa)
+        if len(positions) > 0:
+            QMessageBox.information(self, self.appName, "%s occurrences replaced" % len(positions))
+
+    def findMatches(self, pattern: BytePattern):
+        """
+        Collects the matches from the cursor to the end of the data or,
+        searching backwards, from the start to the cursor. Returns the
+        positions and lengths in two array('q') or None, if the search was
+        canceled.
+        """
+        startIdx = self._hexEdit.cursorPosition // 2
+        backwards = self.ui.cbBackwards.isChecked()
+        engine = SearchEngine(self._hexEdit.chunks.snapshot())
+        positions = Array('q')
+        lengths = Array('q')
+        progress = QProgressDialog("Searching...", "Cancel", 0, 1000, self)
+        # the dialog has no parent, so only blocking all windows keeps the data unchanged
+        progress.setWindowModality(Qt.ApplicationModal)
+        progress.setMinimumDuration(500)
+        for done, total, matches in engine.findMatches(pattern, 0 if backwards else startIdx):
+            if matches is not None:
+                offsets, matchLengths = matches
+                positions.extend(offsets)
+                lengths.extend(matchLengths if matchLengths is not None else Array('q', [pattern.length]) * len(offsets))
+            if backwards and done >= startIdx:
+                break
+            progress.setValue(done * 1000 // total if total > 0 else 0)
+            QApplication.processEvents()
+            if progress.wasCanceled():
+                return None
+        progress.reset()
+        if backwards:
+            # keep the matches which end before the cursor
+            count = len(positions)
+            while count > 0 and positions[count - 1] + lengths[count - 1] > startIdx:
+                count -= 1
+            del positions[count:]
+            del lengths[count:]
+        return positions, lengths
+
+    def replaceAllPrompted(self):
         replaceCounter = 0
         idx = 0
         goOn = QMessageBox.Yes
         
         while (idx >= 0) and (goOn == QMessageBox.Yes):
-            idx = self.findNext()
+            idx, length = self.findNext()
             if idx >= 0:
-                replaceBa = self.getContent(self.ui.cbReplaceFormat.currentIndex(), self.ui.cbReplace.currentText())
-                result = self.replaceOccurrence(idx, replaceBa)
+                replaceBa = self.getReplacement()
+                if replaceBa is None:
+                    break
+                result = self.replaceOccurrence(idx, length, replaceBa)
                 
                 if result == QMessageBox.Yes:
                     replaceCounter += 1
@@ -57,6 +133,29 @@ class SearchDialog(QDialog):
         if replaceCounter > 0:
             QMessageBox.information(self, self.appName, "%s occurrences replaced" % replaceCounter)
             
+    def getPattern(self):
+        # Compiles the search text, returns None for an empty or invalid pattern
+        comboIndex = self.ui.cbFindFormat.currentIndex()
+        inputStr = self.ui.cbFind.currentText()
+        try:
+            if comboIndex == 0:     # hex, with ?? and nibble wildcards
+                pattern = BytePattern.fromHex(inputStr)
+            elif comboIndex == 2:   # regular expression
+                pattern = BytePattern.fromRegex(inputStr)
+            else:
+                pattern = BytePattern.fromBytes(self.getContent(comboIndex, inputStr))
+        except (ValueError, re.error) as e:
+            QMessageBox.warning(self, self.appName, "Invalid search pattern: %s" % e)
+            return None
+        return None if pattern.isEmpty() or inputStr == '' else pattern
+
+    def getReplacement(self):
+        try:
+            return self.getContent(self.ui.cbReplaceFormat.currentIndex(), self.ui.cbReplace.currentText())
+        except ValueError as e:
+            QMessageBox.warning(self, self.appName, "Invalid replacement: %s" % e)
+            return None
+
     def getContent(self, comboIndex, inputStr) -> bytes:
         if comboIndex == 0:     # hex
             findBa = bytes.fromhex(inputStr)
@@ -66,21 +165,17 @@ class SearchDialog(QDialog):
             findBa = bytes()
         return findBa   
     
-    def replaceOccurrence(self, idx, replaceBa):
+    def replaceOccurrence(self, idx, length, replaceBa):
+        # The whole match is replaced the same way as by Replace All, as one undo step
         result = QMessageBox.Yes
-        
-        if len(replaceBa) >= 0:
-            if self.ui.cbPrompt.isChecked():
-                result = QMessageBox.question(self, self.appName, "Replace occurrence?", 
-                             QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel)
-                
-                if result == QMessageBox.Yes:
-                    self._hexEdit.replace(idx, replaceBa)
-                    self._hexEdit.update()
-                    
-            else:
-                self._hexEdit.replace(idx, replaceBa)
-                    
+        if self.ui.cbPrompt.isChecked():
+            result = QMessageBox.question(self, self.appName, "Replace occurrence?",
+                                          QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel)
+        if result == QMessageBox.Yes:
+            self._hexEdit.replaceAll(Array('q', [idx]), Array('q', [length]), replaceBa)
+            # the search goes on behind the replacement, or before it searching backwards
+            after = idx if self.ui.cbBackwards.isChecked() else idx + len(replaceBa)
+            self._hexEdit.setCursorPosition(after * 2)
         return result
 
         
\ No newline at end of file
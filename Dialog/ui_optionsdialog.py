@@ -118,6 +118,17 @@ class Ui_OptionsDialog(object):
         self.sbBytesPerLine.setObjectName("sbBytesPerLine")
         self.gridLayout_4.addWidget(self.sbBytesPerLine, 0, 1, 1, 1)
         self.verticalLayout.addWidget(self.gbHexArea)
+        self.gbSave = QtWidgets.QGroupBox(OptionsDialog)
+        self.gbSave.setObjectName("gbSave")
+        self.gridLayout_5 = QtWidgets.QGridLayout(self.gbSave)
+        self.gridLayout_5.setObjectName("gridLayout_5")
+        self.cbSaveInPlace = QtWidgets.QCheckBox(self.gbSave)
+        self.cbSaveInPlace.setObjectName("cbSaveInPlace")
+        self.gridLayout_5.addWidget(self.cbSaveInPlace, 0, 0, 1, 1)
+        self.cbSaveJournal = QtWidgets.QCheckBox(self.gbSave)
+        self.cbSaveJournal.setObjectName("cbSaveJournal")
+        self.gridLayout_5.addWidget(self.cbSaveJournal, 1, 0, 1, 1)
+        self.verticalLayout.addWidget(self.gbSave)
         spacerItem = QtWidgets.QSpacerItem(20, 28, QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Expanding)
         self.verticalLayout.addItem(spacerItem)
         self.buttonBox = QtWidgets.QDialogButtonBox(OptionsDialog)
@@ -152,3 +163,6 @@ class Ui_OptionsDialog(object):
         self.lbAddressAreaWidth.setText(_translate("OptionsDialog", "Address Area Width"))
         self.gbHexArea.setTitle(_translate("OptionsDialog", "Hex Area"))
         self.lbBytesPerLine.setText(_translate("OptionsDialog", "Bytes per Line"))
+        self.gbSave.setTitle(_translate("OptionsDialog", "Save"))
+        self.cbSaveInPlace.setText(_translate("OptionsDialog", "Write only modified bytes, if the size is unchanged"))
+        self.cbSaveJournal.setText(_translate("OptionsDialog", "Keep a journal to roll back interrupted saves"))
@@ -26,6 +26,7 @@ class Ui_SearchDialog(object):
         self.cbFindFormat.setObjectName("cbFindFormat")
         self.cbFindFormat.addItem("")
         self.cbFindFormat.addItem("")
+        self.cbFindFormat.addItem("")
         self.horizontalLayout.addWidget(self.cbFindFormat)
         self.cbFind = QtWidgets.QComboBox(self.gbFind)
         sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Fixed)
@@ -74,6 +75,9 @@ class Ui_SearchDialog(object):
         self.pbFind.setDefault(True)
         self.pbFind.setObjectName("pbFind")
         self.verticalLayout.addWidget(self.pbFind)
+        self.pbFindAll = QtWidgets.QPushButton(SearchDialog)
+        self.pbFindAll.setObjectName("pbFindAll")
+        self.verticalLayout.addWidget(self.pbFindAll)
         self.pbReplace = QtWidgets.QPushButton(SearchDialog)
         self.pbReplace.setObjectName("pbReplace")
         self.verticalLayout.addWidget(self.pbReplace)
@@ -96,7 +100,8 @@ class Ui_SearchDialog(object):
         SearchDialog.setTabOrder(self.cbReplaceFormat, self.cbBackwards)
         SearchDialog.setTabOrder(self.cbBackwards, self.cbPrompt)
         SearchDialog.setTabOrder(self.cbPrompt, self.pbFind)
-        SearchDialog.setTabOrder(self.pbFind, self.pbReplace)
+        SearchDialog.setTabOrder(self.pbFind, self.pbFindAll)
+        SearchDialog.setTabOrder(self.pbFindAll, self.pbReplace)
         SearchDialog.setTabOrder(self.pbReplace, self.pbReplaceAll)
         SearchDialog.setTabOrder(self.pbReplaceAll, self.pbCancel)
 
@@ -106,6 +111,7 @@ class Ui_SearchDialog(object):
         self.gbFind.setTitle(_translate("SearchDialog", "Find"))
         self.cbFindFormat.setItemText(0, _translate("SearchDialog", "Hex"))
         self.cbFindFormat.setItemText(1, _translate("SearchDialog", "UTF-8"))
+        self.cbFindFormat.setItemText(2, _translate("SearchDialog", "Regex"))
         self.gbReplace.setTitle(_translate("SearchDialog", "Replace"))
         self.cbReplaceFormat.setItemText(0, _translate("SearchDialog", "Hex"))
         self.cbReplaceFormat.setItemText(1, _translate("SearchDialog", "UTF-8"))
@@ -114,6 +120,7 @@ class Ui_SearchDialog(object):
         self.cbPrompt.setText(_translate("SearchDialog", "&Prompt on replace"))
         self.pbFind.setText(_translate("SearchDialog", "&Find"))
         self.pbFind.setShortcut(_translate("SearchDialog", "F3"))
+        self.pbFindAll.setText(_translate("SearchDialog", "Find A&ll"))
         self.pbReplace.setText(_translate("SearchDialog", "&Replace"))
         self.pbReplaceAll.setText(_translate("SearchDialog", "Replace &All"))
         self.pbCancel.setText(_translate("SearchDialog", "&Close"))
@@ -0,0 +1,124 @@
+from PyQt5.QtWidgets import QMainWindow, QSplitter, QLabel, QProgressBar, QAction, QMessageBox
+from PyQt5.QtGui import QCloseEvent, QKeySequence, QColor, QFont
+from PyQt5.QtCore import QFile, QFileInfo, QSettings, Qt
+from App.QHexEdit import QHexEdit
+from App.DiffEngine import DifferenceIndex, compareData
+from App.Worker import Worker
+
+
+# noinspection PyUnresolvedReferences
+class CompareWindow(QMainWindow):
+    """
+    Shows two files side by side, both views scroll together. The bytes at
+    the same positions are compared on a worker thread, the differences are
+    highlighted in both views as they are found and can be stepped through.
+    The views are read-only, the differences belong to the files as loaded.
+    """
+
+    def __init__(self, firstName: str, secondName: str, appName: str = 'PyHexEditor'):
+        super().__init__()
+        self.setAttribute(Qt.WA_DeleteOnClose)
+        self.appName = appName
+        self.differences = DifferenceIndex()
+        self.worker = None
+        self.files = [QFile(firstName), QFile(secondName)]
+        self.hexEdits = [QHexEdit(self), QHexEdit(self)]
+
+        splitter = QSplitter(Qt.Horizontal, self)
+        for hexEdit, file in zip(self.hexEdits, self.files):
+            if not hexEdit.setDataDevice(file):
+                QMessageBox.warning(self, self.appName,
+                                    f"Cannot read the file {file.fileName()}: {file.errorString()}.")
+            hexEdit.readOnly = True
+            hexEdit.marks = self.differences
+            splitter.addWidget(hexEdit)
+        self.setCentralWidget(splitter)
+        self.syncScrolling()
+        self.readSettings()
+
+        self.previousAction = QAction('&Previous Difference', self)
+        self.previousAction.setShortcut(QKeySequence('Shift+F8'))
+        self.previousAction.triggered.connect(self.previousDifference)
+        self.nextAction = QAction('&Next Difference', self)
+        self.nextAction.setShortcut(QKeySequence('F8'))
+        self.nextAction.triggered.connect(self.nextDifference)
+        toolBar = self.addToolBar('Compare')
+        toolBar.addAction(self.previousAction)
+        toolBar.addAction(self.nextAction)
+
+        self.labelResult = QLabel(self)
+        self.progressBar = QProgressBar(self)
+        self.progressBar.setRange(0, 1000)
+        self.statusBar().addWidget(self.labelResult)
+        self.statusBar().addPermanentWidget(self.progressBar)
+
+        self.setWindowTitle(f"{QFileInfo(firstName).fileName()} - {QFileInfo(secondName).fileName()}"
+                            f" - {self.appName}")
+        self.resize(1200, 600)
+        self.compare()
+        self.show()
+
+    def closeEvent(self, event: QCloseEvent) -> None:
+        if self.worker is not None:
+            self.worker.cancel()
+        for hexEdit in self.hexEdits:
+            hexEdit.pageCache.clear()
+
+    def syncScrolling(self) -> None:
+        # Both views show the same addresses
+        first, second = self.hexEdits
+        for source, target in ((first, second), (second, first)):
+            source.verticalScrollBar().valueChanged.connect(target.verticalScrollBar().setValue)
+            source.horizontalScrollBar().valueChanged.connect(target.horizontalScrollBar().setValue)
+
+    def readSettings(self) -> None:
+        settings = QSettings()
+        for hexEdit in self.hexEdits:
+            hexEdit.setHighlightingColor(QColor(settings.value("HighlightingColor", QColor(0xff, 0xff, 0x99))))
+            hexEdit.setAddressAreaColor(QColor(settings.value("AddressAreaColor", QColor(Qt.lightGray))))
+            hexEdit.setSelectionColor(QColor(settings.value("SelectionColor", QColor(0x6d, 0x9e, 0xff))))
+            hexEdit.setFont(QFont(settings.value("WidgetFont", QFont("Courier New", 10))))
+            hexEdit.setAddressWidth(int(settings.value("AddressAreaWidth", 4)))
+            hexEdit.setBytesPerLine(int(settings.value("BytesPerLine", 16)))
+
+    def compare(self) -> None:
+        self.differences.clear()
+        self.worker = Worker(compareData, self.hexEdits[0].chunks.snapshot(), self.hexEdits[1].chunks.snapshot())
+        self.worker.signals.progress.connect(self.showProgress)
+        self.worker.signals.result.connect(self.differencesFound)
+        self.worker.signals.finished.connect(self.compareFinished)
+        self.labelResult.setText('Comparing...')
+        self.worker.start()
+
+    def showProgress(self, done: int, total: int) -> None:
+        self.progressBar.setValue(done * 1000 // total if total > 0 else 1000)
+
+    def differencesFound(self, ranges: tuple) -> None:
+        self.differences.append(*ranges)
+        self.labelResult.setText(f"{len(self.differences)} differences...")
+        for hexEdit in self.hexEdits:
+            hexEdit.viewport().update()
+
+    def compareFinished(self, success: bool) -> None:
+        self.worker = None
+        self.progressBar.hide()
+        state = '' if success else ' (canceled)'
+        self.labelResult.setText(f"{len(self.differences)} differences, "
+                                 f"{self.differences.totalBytes()} bytes{state}")
+
+    def nextDifference(self) -> None:
+        self.showDifference(self.differences.next(self.hexEdits[0].bPosCurrent))
+
+    def previousDifference(self) -> None:
+        hexEdit = self.hexEdits[0]
+        self.showDifference(self.differences.previous(min(hexEdit.bPosCurrent, hexEdit.getSelectionBegin())))
+
+    def showDifference(self, difference: tuple) -> None:
+        if difference is None:
+            self.statusBar().showMessage('No more differences', 2000)
+            return
+        position, length = difference
+        for hexEdit in self.hexEdits:
+            # the range may reach behind the end of the shorter file
+            size = hexEdit.chunks.size
+            hexEdit.selectRange(min(position, size), max(min(position + length, size) - position, 0))
@@ -1,33 +1,57 @@
-from PyQt5.QtWidgets import QMainWindow, QMenu, QToolBar, QAction, QLabel, QMessageBox, QFileDialog
+from PyQt5.QtWidgets import QMainWindow, QMenu, QToolBar, QAction, QLabel, QMessageBox, QFileDialog, QProgressDialog, \
+    QDockWidget, QTabWidget, QApplication
 from PyQt5.QtGui import QCloseEvent, QDragEnterEvent, QDropEvent, QIcon, QKeySequence, QColor, QFont
-from PyQt5.QtCore import QFile, QSize, QFileInfo, QSettings, QSaveFile, QTextStream, QPoint
+from PyQt5.QtCore import QFile, QSize, QFileInfo, QSettings, QSaveFile, QPoint, Qt, QTimer, QEventLoop
 from Dialog.OptionsDialog import OptionsDialog
 from Dialog.SearchDialog import SearchDialog
+from Window.CompareWindow import CompareWindow
 from App.QHexEdit import QHexEdit
+from App.Document import Document
+from App.Chunks import Chunks
+from App.SearchResults import SearchResults
+from App.ChecksumPanel import ChecksumPanel
+from App.BytePattern import BytePattern
+from App.Signatures import Signatures
+from App.Readable import writeReadable
+from App.Worker import Worker
+from App.Stats import stats
+import cProfile
 
 
 class QHexWindow(QMainWindow):
+    """
+    Main window, every open file is a Document in a tab of its own. The
+    actions, dialogs and docks work on the document of the current tab.
+    """
+
     def __init__(self, name='PyHexEditor'):
         super().__init__()
 
         self.appName = name
 
-        self.currentFile = str()
-        self.isUntitled = True
+        self.saveInPlace = True
+        self.saveJournal = True
 
-        self.hexEdit = QHexEdit(self)
+        # The options dialog writes the default settings, which the documents read
+        self.optionsDialog = OptionsDialog(self)
+        self.tabWidget = QTabWidget(self)
+        self.documents = {} # by their QHexEdit, which is the widget of their tab
+        self.searchDocument = None # the document of the search results
+        self.newDocument()
 
-        self.file = QFile()
         self.fileMenu = QMenu()
         self.editMenu = QMenu()
+        self.toolsMenu = QMenu()
         self.helpMenu = QMenu()
         self.labelSize = QLabel()
         self.labelAddress = QLabel()
         self.labelOverwriteMode = QLabel()
+        self.labelStats = QLabel()
         self.fileToolBar = QToolBar()
         self.editToolBar = QToolBar()
         self.undoAction = QAction()
         self.redoAction = QAction()
+        self.newAction = QAction()
         self.openAction = QAction()
         self.saveAction = QAction()
         self.exitAction = QAction()
@@ -36,12 +60,25 @@ class QHexWindow(QMainWindow):
         self.closeAction = QAction()
         self.saveAsAction = QAction()
         self.saveReadableAction = QAction()
+        self.compareAction = QAction()
         self.aboutQtAction = QAction()
         self.optionsAction = QAction()
         self.findNextAction = QAction()
         self.saveReadableSelectionAction = QAction()
-        self.optionsDialog = OptionsDialog(self)
+        self.checksumsAction = QAction()
+        self.showStatsAction = QAction()
+        self.exportStatsAction = QAction()
+        self.profileAction = QAction()
         self.searchDialog = SearchDialog(self, self.hexEdit)
+        self.searchResults = SearchResults(self)
+        self.searchResultsDock = QDockWidget('Search Results', self)
+        self.checksumPanel = ChecksumPanel(self.hexEdit, self)
+        self.checksumDock = QDockWidget('Checksums', self)
+        self.readableWorker = None
+        self.saveWorker = None
+        self.statsTimer = QTimer(self)
+        self.profiler = None
+        self.compareWindows = [] # they have no parent, the window keeps them alive
 
         self.setAcceptDrops(True)
         self.init()
@@ -49,8 +86,106 @@ class QHexWindow(QMainWindow):
         self.setMinimumSize(QSize(770, 390))
         self.show()
 
+    @property
+    def document(self) -> Document:
+        return self.documents[self.tabWidget.currentWidget()]
+
+    @property
+    def hexEdit(self) -> QHexEdit:
+        return self.document.hexEdit
+
+    @property
+    def file(self) -> QFile:
+        return self.document.file
+
+    @property
+    def currentFile(self) -> str:
+        return self.document.currentFile
+
+    @property
+    def isUntitled(self) -> bool:
+        return self.document.isUntitled
+
+    def newDocument(self) -> Document:
+        document = Document(self)
+        hexEdit = document.hexEdit
+        self.documents[hexEdit] = document
+        self.applySettings(hexEdit)
+        hexEdit.dataChanged.connect(lambda: self.documentChanged(document))
+        hexEdit.overwriteModeChanged.connect(self.setOverwriteMode)
+        hexEdit.currentAddressChanged.connect(self.setAddress)
+        hexEdit.currentSizeChanged.connect(self.setSize)
+        self.tabWidget.addTab(hexEdit, document.title())
+        self.tabWidget.setCurrentWidget(hexEdit)
+        return document
+
+    def closeDocument(self, index: int):
+        # There is always one document, closing the last one leaves an untitled one
+        hexEdit = self.tabWidget.widget(index)
+        self.waitForSave()
+        if not self.maybeSave(self.documents[hexEdit]):
+            return
+        document = self.documents.pop(hexEdit)
+        if document is self.searchDocument:
+            self.searchResults.cancel()
+            self.searchDocument = None
+        if len(self.documents) == 0:
+            self.newDocument()
+        self.tabWidget.removeTab(self.tabWidget.indexOf(hexEdit))
+        document.close()
+        hexEdit.deleteLater()
+
+    def documentActivated(self):
+        # The dialogs, docks and the status bar follow the current tab
+        hexEdit = self.hexEdit
+        self.searchDialog.setHexEdit(hexEdit)
+        self.checksumPanel.setHexEdit(hexEdit)
+        self.setAddress(hexEdit.bPosCurrent)
+        self.setSize(hexEdit.chunks.size)
+        self.setOverwriteMode(hexEdit.overwriteMode)
+        self.setCurrentFile(self.currentFile)
+        self.setWindowModified(self.document.isModified())
+
+    def documentChanged(self, document: Document):
+        self.tabWidget.setTabText(self.tabWidget.indexOf(document.hexEdit), document.title())
+        if document is self.document:
+            self.dataChanged()
+
+    def maybeSave(self, document: Document) -> bool:
+        # Asks to save a modified document, False if closing it was canceled
+        if not document.isModified():
+            return True
+        self.tabWidget.setCurrentWidget(document.hexEdit)
+        answer = QMessageBox.warning(self, self.appName, f"{document.name()} has been modified.\n"
+                                     "Do you want to save your changes?",
+                                     QMessageBox.Save | QMessageBox.Discard | QMessageBox.Cancel)
+        if answer == QMessageBox.Save:
+            if not self.save():
+                return False
+            self.waitForSave()
+            return not document.isModified()
+        return answer == QMessageBox.Discard
+
+    def waitForSave(self) -> None:
+        # The events are processed until a running saveFile() is finished
+        while self.saveWorker is not None:
+            QApplication.processEvents(QEventLoop.WaitForMoreEvents)
+
     def closeEvent(self, event: QCloseEvent) -> None:
-        self.hexEdit.undoStack.clear()
+        self.waitForSave()
+        for document in list(self.documents.values()):
+            if not self.maybeSave(document):
+                event.ignore()
+                return
+        self.searchResults.cancel()
+        self.checksumPanel.cancel()
+        if self.readableWorker is not None:
+            self.readableWorker.cancel()
+        for document in self.documents.values():
+            document.close()
+        if self.profiler is not None:
+            self.profiler.disable()
+        self.statsTimer.stop()
         self.writeSettings()
 
     def dragEnterEvent(self, event: QDragEnterEvent) -> None:
@@ -59,9 +194,8 @@ class QHexWindow(QMainWindow):
 
     def dropEvent(self, event: QDropEvent) -> None:
         if event.mimeData().hasUrls():
-            urls = event.mimeData().urls()
-            filepath = urls[0].toLocalFile()
-            self.loadFile(filepath)
+            for url in event.mimeData().urls():
+                self.loadFile(url.toLocalFile())
             event.accept()
 
     def about(self):
@@ -78,22 +212,65 @@ class QHexWindow(QMainWindow):
     def open(self):
         options = QFileDialog().Options()
         options |= QFileDialog.DontUseNativeDialog
-        filename, _ = QFileDialog.getOpenFileName(self, "Select File", options=options)
-        if filename:
+        filenames, _ = QFileDialog.getOpenFileNames(self, "Select Files", options=options)
+        for filename in filenames:
             self.loadFile(filename)
 
+    def compareFiles(self):
+        # The shown file is offered as the first one
+        first, _ = QFileDialog.getOpenFileName(self, "Select First File", self.currentFile)
+        if not first:
+            return None
+        second, _ = QFileDialog.getOpenFileName(self, "Select Second File", first)
+        if not second:
+            return None
+        window = CompareWindow(first, second, self.appName)
+        self.compareWindows.append(window)
+        window.destroyed.connect(lambda: self.compareWindows.remove(window))
+        return window
+
+    def findAll(self, pattern: BytePattern):
+        self.searchResultsDock.show()
+        self.searchDocument = self.document
+        self.searchResults.findAll(self.hexEdit.chunks, pattern)
+
+    def jumpTo(self, position: int, length: int):
+        # The results belong to the document they were found in
+        if self.searchDocument is None:
+            return
+        self.tabWidget.setCurrentWidget(self.searchDocument.hexEdit)
+        self.hexEdit.selectRange(position, length)
+
+    def scanSignatures(self):
+        settings = QSettings()
+        filename, _ = QFileDialog.getOpenFileName(self, 'Select Signature File', settings.value("SignatureFile", ''),
+                                                  filter="Signature files (*.txt);;All files (*.*)")
+        if not filename:
+            return
+        try:
+            signatures = Signatures.load(filename)
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, self.appName, f"Cannot load signatures:\n{e}")
+            return
+        settings.setValue("SignatureFile", filename)
+        self.searchResultsDock.show()
+        self.searchDocument = self.document
+        self.searchResults.scanSignatures(self.hexEdit.chunks, signatures)
+
     def optionsAccepted(self):
         self.writeSettings()
         self.readSettings()
 
     def findNext(self):
         self.searchDialog.findNext()
+        engine = self.hexEdit.chunks.searchEngine
+        self.statusBar().showMessage(
+            f"Searched {engine.bytesScanned} bytes, {engine.throughput() / 0x100000:.0f} MiB/s", 2000)
 
     def save(self):
         if self.isUntitled:
-            self.saveAs()
-        else:
-            self.saveFile(self.currentFile)
+            return self.saveAs()
+        return self.saveFile(self.currentFile)
 
     def saveAs(self):
         filename, _ = QFileDialog.getSaveFileName(self, 'Save As...', self.currentFile)
@@ -122,18 +299,87 @@ class QHexWindow(QMainWindow):
             self.currentFile.rsplit('.')[0] + defSuffix, filter=filters, initialFilter=defFilter)
         return self.saveReadableFile(filename)
 
+    def isBackground(self) -> bool:
+        # Signals of the editors of the other tabs are not shown
+        sender = self.sender()
+        return isinstance(sender, QHexEdit) and sender is not self.hexEdit
+
     def setAddress(self, addr):
+        if self.isBackground():
+            return
         self.labelAddress.setText(str(addr))
 
     def setOverwriteMode(self, mode):
+        if self.isBackground():
+            return
         if mode:
             self.labelOverwriteMode.setText("Overwrite")
         else:
             self.labelOverwriteMode.setText("Insert")
 
     def setSize(self, size):
+        if self.isBackground():
+            return
         self.labelSize.setText(str(size))
 
+    def showChecksums(self):
+        self.checksumDock.show()
+        self.checksumPanel.compute()
+
+    def showStats(self, show: bool):
+        stats.enabled = show
+        self.labelStats.setVisible(show)
+        if show:
+            stats.reset()
+            self.updateStats()
+            self.statsTimer.start()
+        else:
+            self.statsTimer.stop()
+
+    def updateStats(self):
+        # Time of the recent frames and the data read since the statistics were enabled
+        paint = stats.get('QHexEdit.paintEvent')
+        data = stats.get('Chunks.data')
+        device = stats.get('device.read')
+        self.labelStats.setText(f"Frame {paint['recentSeconds'] * 1000:.1f} ms "
+                                f"(max {paint['maxSeconds'] * 1000:.1f}), "
+                                f"data {data['calls']} calls {data['amount'] / 0x100000:.1f} MiB, "
+                                f"device {device['amount'] / 0x100000:.1f} MiB")
+
+    def exportStats(self):
+        filename, _ = QFileDialog.getSaveFileName(self, 'Export Statistics...', 'statistics.json',
+                                                  filter="JSON files (*.json);;All files (*.*)")
+        if not filename:
+            return False
+        try:
+            stats.export(filename)
+        except OSError as e:
+            QMessageBox.warning(self, self.appName, f"Cannot write file {filename}: {e}.")
+            return False
+        self.statusBar().showMessage('Statistics Saved', 2000)
+        return True
+
+    def profile(self, start: bool):
+        # Only the main thread is profiled, the workers run on their own threads
+        if start:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+            return
+        if self.profiler is None:
+            return
+        self.profiler.disable()
+        profiler, self.profiler = self.profiler, None
+        filename, _ = QFileDialog.getSaveFileName(self, 'Save Profile...', 'profile.prof',
+                                                  filter="Profile files (*.prof);;All files (*.*)")
+        if not filename:
+            return
+        try:
+            profiler.dump_stats(filename)
+        except OSError as e:
+            QMessageBox.warning(self, self.appName, f"Cannot write file {filename}: {e}.")
+            return
+        self.statusBar().showMessage('Profile Saved', 2000)
+
     def showOptionsDialog(self):
         self.optionsDialog.show()
 
@@ -149,19 +395,27 @@ class QHexWindow(QMainWindow):
     # noinspection PyUnresolvedReferences
     def init(self):
         self.optionsDialog.accepted.connect(self.optionsAccepted)
-        self.hexEdit.dataChanged.connect(self.dataChanged)
-        self.hexEdit.overwriteModeChanged.connect(self.setOverwriteMode)
+        self.tabWidget.setTabsClosable(True)
+        self.tabWidget.setDocumentMode(True)
+        self.tabWidget.tabCloseRequested.connect(self.closeDocument)
+        self.tabWidget.currentChanged.connect(self.documentActivated)
 
         self.setUnifiedTitleAndToolBarOnMac(True)
-        self.setCentralWidget(self.hexEdit)
+        self.setCentralWidget(self.tabWidget)
         self.createActions()
         self.createMenus()
         self.createStatusBar()
         self.createToolBars()
+        self.createDockWidgets()
         self.readSettings()
 
     # noinspection PyUnresolvedReferences
     def createActions(self):
+        self.newAction = QAction('&New', self)
+        self.newAction.setStatusTip('Open an empty tab')
+        self.newAction.setShortcut(QKeySequence.New)
+        self.newAction.triggered.connect(self.newDocument)
+
         self.openAction = QAction(QIcon('Icons/MenuOpen.svg'), '&Open', self)
         self.openAction.setStatusTip('Open a existing file')
         self.openAction.setShortcut(QKeySequence.Open)
@@ -181,9 +435,18 @@ class QHexWindow(QMainWindow):
         self.saveReadableAction.setStatusTip('Save the file as readable ...')
         self.saveReadableAction.triggered.connect(self.saveReadable)
 
+        self.compareAction = QAction('&Compare Files...', self)
+        self.compareAction.setStatusTip('Show the differences of two files side by side')
+        self.compareAction.triggered.connect(self.compareFiles)
+
+        self.closeAction = QAction('&Close', self)
+        self.closeAction.setStatusTip('Close the current tab')
+        self.closeAction.setShortcut(QKeySequence.Close)
+        self.closeAction.triggered.connect(lambda: self.closeDocument(self.tabWidget.currentIndex()))
+
         self.exitAction = QAction('E&xit', self)
         self.exitAction.setStatusTip('Exit the program')
-        self.exitAction.setShortcut(QKeySequence.Close)
+        self.exitAction.setShortcut(QKeySequence.Quit)
         self.exitAction.triggered.connect(self.close)
 
         self.undoAction = QAction(QIcon('Icons/Undo.svg'), '&Undo', self)
@@ -218,17 +481,43 @@ class QHexWindow(QMainWindow):
         self.findNextAction.setStatusTip('Find a next occurrence')
         self.findNextAction.triggered.connect(self.findNext)
 
+        self.scanSignaturesAction = QAction('Scan &Signatures...', self)
+        self.scanSignaturesAction.setStatusTip('Find all sequences of a signature file')
+        self.scanSignaturesAction.triggered.connect(self.scanSignatures)
+
         self.optionsAction = QAction('&Options', self)
         self.optionsAction.setStatusTip('Show the settings dialog')
         self.optionsAction.triggered.connect(self.showOptionsDialog)
 
+        self.checksumsAction = QAction('&Checksums', self)
+        self.checksumsAction.setStatusTip('Compute MD5, SHA-1, SHA-256 and CRC32 of the file or the selection')
+        self.checksumsAction.triggered.connect(self.showChecksums)
+
+        self.showStatsAction = QAction('Show &Statistics', self)
+        self.showStatsAction.setCheckable(True)
+        self.showStatsAction.setStatusTip('Record the timings of the editor and show them in the status bar')
+        self.showStatsAction.toggled.connect(self.showStats)
+
+        self.exportStatsAction = QAction('&Export Statistics...', self)
+        self.exportStatsAction.setStatusTip('Save the recorded timings as JSON')
+        self.exportStatsAction.triggered.connect(self.exportStats)
+
+        self.profileAction = QAction('&Profile', self)
+        self.profileAction.setCheckable(True)
+        self.profileAction.setStatusTip('Run the profiler until unchecked and save its statistics')
+        self.profileAction.toggled.connect(self.profile)
+
     def createMenus(self):
         self.fileMenu = self.menuBar().addMenu('&File')
+        self.fileMenu.addAction(self.newAction)
         self.fileMenu.addAction(self.openAction)
         self.fileMenu.addAction(self.saveAction)
         self.fileMenu.addAction(self.saveAsAction)
         self.fileMenu.addAction(self.saveReadableAction)
         self.fileMenu.addSeparator()
+        self.fileMenu.addAction(self.compareAction)
+        self.fileMenu.addSeparator()
+        self.fileMenu.addAction(self.closeAction)
         self.fileMenu.addAction(self.exitAction)
 
         self.editMenu = self.menuBar().addMenu('&Edit')
@@ -239,9 +528,18 @@ class QHexWindow(QMainWindow):
         self.editMenu.addSeparator()
         self.editMenu.addAction(self.findAction)
         self.editMenu.addAction(self.findNextAction)
+        self.editMenu.addAction(self.scanSignaturesAction)
         self.editMenu.addSeparator()
         self.editMenu.addAction(self.optionsAction)
 
+        self.toolsMenu = self.menuBar().addMenu('&Tools')
+        self.toolsMenu.addAction(self.checksumsAction)
+        self.toolsMenu.addSeparator()
+        self.toolsMenu.addAction(self.showStatsAction)
+        self.toolsMenu.addAction(self.exportStatsAction)
+        self.toolsMenu.addSeparator()
+        self.toolsMenu.addAction(self.profileAction)
+
         self.helpMenu = self.menuBar().addMenu('&Help')
         self.helpMenu.addAction(self.aboutAction)
         self.helpMenu.addAction(self.aboutQtAction)
@@ -250,18 +548,21 @@ class QHexWindow(QMainWindow):
         self.statusBar().addPermanentWidget(QLabel('Address:'))
         self.labelAddress.setMinimumWidth(70)
         self.statusBar().addPermanentWidget(self.labelAddress)
-        self.hexEdit.currentAddressChanged.connect(self.setAddress)
 
         self.statusBar().addPermanentWidget(QLabel('Size:'))
         self.labelSize.setMinimumWidth(70)
         self.statusBar().addPermanentWidget(self.labelSize)
-        self.hexEdit.currentSizeChanged.connect(self.setSize)
 
         self.statusBar().addPermanentWidget(QLabel('Mode:'))
         self.labelOverwriteMode.setMinimumWidth(70)
         self.statusBar().addPermanentWidget(self.labelOverwriteMode)
         self.setOverwriteMode(self.hexEdit.overwriteMode)
 
+        self.statusBar().addPermanentWidget(self.labelStats)
+        self.labelStats.hide()
+        self.statsTimer.setInterval(500)
+        self.statsTimer.timeout.connect(self.updateStats)
+
         self.statusBar().showMessage('Ready', 2000)
 
     def createToolBars(self):
@@ -276,7 +577,47 @@ class QHexWindow(QMainWindow):
         self.editToolBar.addAction(self.redoAction)
         self.editToolBar.addAction(self.findAction)
 
+    def createDockWidgets(self):
+        self.searchResultsDock.setObjectName('searchResultsDock')
+        self.searchResultsDock.setWidget(self.searchResults)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.searchResultsDock)
+        self.searchResultsDock.hide()
+        self.searchDialog.findAllRequested.connect(self.findAll)
+        self.searchResults.jumpTo.connect(self.jumpTo)
+
+        self.checksumDock.setObjectName('checksumDock')
+        self.checksumDock.setWidget(self.checksumPanel)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.checksumDock)
+        self.checksumDock.hide()
+
+    def isFileInUse(self, filename: str) -> bool:
+        # Documents read their original data from the file, directly or through a map
+        canonical = QFileInfo(filename).canonicalFilePath()
+        return Chunks.isMapped(filename) or \
+            any(QFileInfo(document.file).canonicalFilePath() == canonical for document in self.documents.values())
+
     def loadFile(self, filename: str):
+        # A file which is open already is shown, others get a tab of their own
+        canonical = QFileInfo(filename).canonicalFilePath()
+        for document in self.documents.values():
+            if not document.isUntitled and document.currentFile == canonical:
+                self.tabWidget.setCurrentWidget(document.hexEdit)
+                return
+        journalName = self.journalName(filename)
+        if QFileInfo(journalName).exists():
+            answer = QMessageBox.question(self, self.appName,
+                                          f"The last save of {filename} was interrupted. Roll back its changes?")
+            if answer == QMessageBox.Yes:
+                if self.isFileInUse(filename):
+                    QMessageBox.warning(self, self.appName,
+                                        f"Cannot roll back the file {filename} while it is open, "
+                                        "the journal is kept.")
+                elif not Chunks.rollbackJournal(filename, journalName):
+                    QMessageBox.warning(self, self.appName, f"Cannot roll back the file {filename}.")
+            else:
+                QFile.remove(journalName)
+        if not self.document.isPristine():
+            self.newDocument()
         self.file.setFileName(filename)
         if not self.hexEdit.setDataDevice(self.file):
             QMessageBox.warning(self, "Hex",
@@ -292,56 +633,177 @@ class QHexWindow(QMainWindow):
         self.move(pos)
         self.resize(size)
 
-        self.hexEdit.setAddressArea(settings.value("AddressArea") == 'true')
-        self.hexEdit.setAsciiArea(settings.value("AsciiArea") == 'true')
-        self.hexEdit.highlighting = (settings.value("Highlighting") == 'true')
-        self.hexEdit.setOverwriteMode(settings.value("OverwriteMode") == 'true')
-        self.hexEdit.readOnly = (settings.value("ReadOnly") == 'true')
+        self.saveInPlace = (settings.value("SaveInPlace") == 'true')
+        self.saveJournal = (settings.value("SaveJournal") == 'true')
+        for hexEdit in self.documents:
+            self.applySettings(hexEdit)
+
+    @staticmethod
+    def applySettings(hexEdit: QHexEdit):
+        settings = QSettings()
+        hexEdit.setAddressArea(settings.value("AddressArea") == 'true')
+        hexEdit.setAsciiArea(settings.value("AsciiArea") == 'true')
+        hexEdit.highlighting = (settings.value("Highlighting") == 'true')
+        hexEdit.setOverwriteMode(settings.value("OverwriteMode") == 'true')
+        hexEdit.readOnly = (settings.value("ReadOnly") == 'true')
 
-        self.hexEdit.setHighlightingColor(QColor(settings.value("HighlightingColor")))
-        self.hexEdit.setAddressAreaColor(QColor(settings.value("AddressAreaColor")))
-        self.hexEdit.setSelectionColor(QColor(settings.value("SelectionColor")))
-        self.hexEdit.setFont(QFont(settings.value("WidgetFont")))
+        hexEdit.setHighlightingColor(QColor(settings.value("HighlightingColor")))
+        hexEdit.setAddressAreaColor(QColor(settings.value("AddressAreaColor")))
+        hexEdit.setSelectionColor(QColor(settings.value("SelectionColor")))
+        hexEdit.setFont(QFont(settings.value("WidgetFont")))
 
-        self.hexEdit.setAddressWidth(int(settings.value("AddressAreaWidth")))
-        self.hexEdit.setBytesPerLine(int(settings.value("BytesPerLine")))
+        hexEdit.setAddressWidth(int(settings.value("AddressAreaWidth")))
+        hexEdit.setBytesPerLine(int(settings.value("BytesPerLine")))
 
     def saveFile(self, filename: str):
-        data_to_save = self.hexEdit.chunks.data(0, -1)
+        chunks = self.hexEdit.chunks
+        # If the shown file is saved and its size is unchanged, it is patched in place
+        shownFile = QFileInfo(self.file).canonicalFilePath()
+        isShownFile = len(shownFile) > 0 and shownFile == QFileInfo(filename).canonicalFilePath()
+        if isShownFile and self.saveInPlace and chunks.dirtyRanges() is not None:
+            return self.saveFileInPlace(filename)
+
+        if self.saveWorker is not None:
+            QMessageBox.warning(self, self.appName, "A file is being saved already.")
+            return False
         newfile = QSaveFile(filename)
         if not newfile.open(QSaveFile.WriteOnly | QSaveFile.Truncate):
             QMessageBox.warning(self, self.appName,
                                 f"Cannot open file {filename} for writing: {newfile.errorString()}.")
             return False
-        newfile.write(data_to_save)
+
+        # The data is streamed block by block on a worker thread, the file is committed when it is finished
+        document = self.document
+        version = chunks.version
+        progress = QProgressDialog('Saving file...', 'Cancel', 0, 1000, self)
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(500)
+        worker = Worker(chunks.snapshot().write, newfile)
+        worker.signals.progress.connect(lambda done, count: progress.setValue(done * 1000 // count))
+        worker.signals.finished.connect(lambda success: self.fileSaved(document, newfile, progress, isShownFile,
+                                                                       version, success))
+        progress.canceled.connect(worker.cancel)
+        self.saveWorker = worker
+        worker.start()
+        return True
+
+    def fileSaved(self, document: Document, newfile: QSaveFile, progress: QProgressDialog, isShownFile: bool,
+                  version: int, success: bool):
+        canceled = self.saveWorker.canceled
+        self.saveWorker = None
+        progress.reset()
+        progress.deleteLater()
+        filename = newfile.fileName()
+        hexEdit = document.hexEdit
+        chunks = hexEdit.chunks
+        if success and chunks.version != version:
+            # The file holds the data from the start of the save, it would not be the shown one
+            newfile.cancelWriting()
+            QMessageBox.warning(self, self.appName, f"The data changed while {filename} was saved, "
+                                                    "it is not saved.")
+            return
+        if not success:
+            # An uncommitted QSaveFile is discarded, the target file stays untouched
+            newfile.cancelWriting()
+            if not canceled:
+                QMessageBox.warning(self, self.appName, f"Cannot write file {filename}: {newfile.errorString()}.")
+            return
+
+        # The saved file replaces the one which is shown, it has to be unmapped before
+        if isShownFile:
+            chunks.unmapDevice()
         if newfile.commit():
-            self.setCurrentFile(filename)
+            if isShownFile:
+                # The original data is changed, so the edits are based on the saved file now
+                hexEdit.setDataDevice(document.file)
+                hexEdit.undoStack.clear()
+            else:
+                # The history is kept, its current state is the saved one
+                hexEdit.undoStack.setClean()
+            self.setCurrentFile(filename, document)
             self.statusBar().showMessage('File Saved', 2000)
-            return True
         else:
+            if isShownFile:
+                chunks.mapDevice()
             QMessageBox.warning(self, self.appName,
                                 f"Cannot write file {filename}: {newfile.errorString()}.")
+
+    def saveFileInPlace(self, filename: str):
+        # Only the modified bytes are written, the size of the file is unchanged
+        journalName = self.journalName(filename) if self.saveJournal else None
+        try:
+            saved = self.hexEdit.chunks.writeInPlace(journalName)
+        except OSError as error:
+            # The edited data is still shown, but the file which the history refers to is damaged
+            self.hexEdit.undoStack.clear()
+            self.hexEdit.undoStack.resetClean()
+            QMessageBox.warning(self, self.appName, f"Cannot write file {filename}: {error}.")
             return False
+        if not saved:
+            QMessageBox.warning(self, self.appName, f"Cannot write file {filename}.")
+            return False
+        self.hexEdit.setDataDevice(self.file)
+        self.hexEdit.undoStack.clear()
+        self.setCurrentFile(filename)
+        self.statusBar().showMessage('File Saved', 2000)
+        return True
 
-    def saveReadableFile(self, filename: str):
-        readable_data = self.hexEdit.toReadableString()
-        file = QFile(filename)
-        file.open(QFile.WriteOnly | QFile.Text)
-        out = QTextStream(file)
-        out << readable_data
-        file.close()
+    @staticmethod
+    def journalName(filename: str) -> str:
+        return filename + '.journal'
+
+    def saveReadableFile(self, filename: str, selection: bool = False):
+        # The text is written block by block on a worker thread, the data can be edited meanwhile
+        if len(filename) == 0:
+            return False
+        if self.readableWorker is not None:
+            QMessageBox.warning(self, self.appName, "A readable file is being saved already.")
+            return False
+        newfile = QSaveFile(filename)
+        if not newfile.open(QSaveFile.WriteOnly | QSaveFile.Truncate | QSaveFile.Text):
+            QMessageBox.warning(self, self.appName,
+                                f"Cannot open file {filename} for writing: {newfile.errorString()}.")
+            return False
+        if selection:
+            total = self.hexEdit.getSelectionEnd() - self.hexEdit.getSelectionBegin()
+        else:
+            total = self.hexEdit.chunks.size
+        progress = QProgressDialog('Saving readable file...', 'Cancel', 0, 1000, self)
+        progress.setMinimumDuration(500)
+        worker = Worker(writeReadable, newfile, self.hexEdit.toReadableBlocks(selection), total)
+        worker.signals.progress.connect(lambda done, count: progress.setValue(done * 1000 // count))
+        worker.signals.finished.connect(lambda success: self.readableFileSaved(newfile, progress, success))
+        progress.canceled.connect(worker.cancel)
+        self.readableWorker = worker
+        worker.start()
+        return True
 
     def saveSelectionReadableFile(self, filename: str):
-        readable_data = self.hexEdit.selectionToReadableString()
-        file = QFile(filename)
-        file.open(QFile.WriteOnly | QFile.Text)
-        out = QTextStream(file)
-        out << readable_data
-        file.close()
-
-    def setCurrentFile(self, filename: str):
-        self.currentFile = QFileInfo(filename).canonicalFilePath()
-        self.isUntitled = (len(self.currentFile) == 0)
+        return self.saveReadableFile(filename, True)
+
+    def readableFileSaved(self, newfile: QSaveFile, progress: QProgressDialog, success: bool):
+        canceled = self.readableWorker.canceled
+        self.readableWorker = None
+        progress.reset()
+        progress.deleteLater()
+        error = newfile.errorString()
+        if not success:
+            # The temporary file is removed, an existing file stays untouched
+            newfile.cancelWriting()
+        if newfile.commit():
+            self.statusBar().showMessage('File Saved', 2000)
+        elif not canceled:
+            QMessageBox.warning(self, self.appName, f"Cannot write file {newfile.fileName()}: {error}.")
+
+    def setCurrentFile(self, filename: str, document: Document = None):
+        # Of the current document by default, the title of the window follows the current one
+        if document is None:
+            document = self.document
+        document.currentFile = QFileInfo(filename).canonicalFilePath()
+        document.isUntitled = (len(document.currentFile) == 0)
+        self.tabWidget.setTabText(self.tabWidget.indexOf(document.hexEdit), document.title())
+        if document is not self.document:
+            return
         self.setWindowModified(False)
         if self.isUntitled:
             self.setWindowFilePath(self.appName)